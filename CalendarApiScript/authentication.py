@@ -1,10 +1,10 @@
 import os
-import pickle
+import json
 from datetime import timedelta
 from google_auth_oauthlib.flow import Flow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from flask import session, redirect, url_for, request
+from token_store import TokenStore
+from google_services import build_service, discovery_document
 
 class Auth:
     def __init__(self, app):
@@ -23,6 +23,16 @@ class Auth:
         if not os.path.exists(self.TOKEN_DIR):
             os.makedirs(self.TOKEN_DIR)
 
+        # Config OAuth lue une seule fois au démarrage
+        with open(self.CLIENT_SECRETS_FILE, 'r') as f:
+            self.client_config = json.load(f)
+        # Charge le document de discovery maintenant plutôt qu'au premier /callback
+        discovery_document('oauth2', 'v2')
+
+        # Tokens gardés en mémoire et rafraîchis avant leur expiration
+        self.token_store = TokenStore(self.TOKEN_DIR)
+        self.token_store.start_background_refresh()
+
         self.init_auth()
         self.setup_auth_routes()
 
@@ -39,30 +49,8 @@ class Auth:
             session.permanent = True
 
     def check_token_validity(self, user_email):
-        """Vérifie si le token existe et est valide"""
-        token_path = os.path.join(self.TOKEN_DIR, f"{user_email}.pickle")
-
-        if not os.path.exists(token_path):
-            return None
-
-        try:
-            with open(token_path, 'rb') as token_file:
-                credentials = pickle.load(token_file)
-
-            if credentials and credentials.valid:
-                return credentials
-
-            if credentials and credentials.expired and credentials.refresh_token:
-                credentials.refresh(Request())
-                with open(token_path, 'wb') as token_file:
-                    pickle.dump(credentials, token_file)
-                return credentials
-
-        except Exception as e:
-            print(f"Erreur token: {str(e)}")
-            return None
-
-        return None
+        """Vérifie si le token existe et est valide (ou en cours de rafraîchissement)"""
+        return self.token_store.get(user_email)
 
     def require_auth(self, f):
         """Décorateur pour protéger les routes"""
@@ -95,8 +83,8 @@ class Auth:
                 if credentials:
                     return redirect(url_for('events_page'))
 
-            flow = Flow.from_client_secrets_file(
-                self.CLIENT_SECRETS_FILE,
+            flow = Flow.from_client_config(
+                self.client_config,
                 scopes=self.SCOPES,
                 redirect_uri=self.REDIRECT_URI
             )
@@ -113,8 +101,8 @@ class Auth:
         @self.app.route("/callback")
         def callback():
             try:
-                flow = Flow.from_client_secrets_file(
-                    self.CLIENT_SECRETS_FILE,
+                flow = Flow.from_client_config(
+                    self.client_config,
                     scopes=self.SCOPES,
                     redirect_uri=self.REDIRECT_URI,
                     state=session['state']
@@ -123,7 +111,7 @@ class Auth:
                 flow.fetch_token(authorization_response=request.url)
                 credentials = flow.credentials
 
-                oauth_service = build('oauth2', 'v2', credentials=credentials)
+                oauth_service = build_service('oauth2', 'v2', credentials)
                 user_info = oauth_service.userinfo().get().execute()
                 user_email = user_info.get('email', 'unknown')
 
@@ -131,9 +119,7 @@ class Auth:
                 session['user_name'] = user_info.get('name', 'Utilisateur')
                 session.modified = True
 
-                token_path = os.path.join(self.TOKEN_DIR, f"{user_email}.pickle")
-                with open(token_path, 'wb') as token_file:
-                    pickle.dump(credentials, token_file)
+                self.token_store.save(user_email, credentials)
 
                 return redirect(url_for('events_page'))
 
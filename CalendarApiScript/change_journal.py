@@ -0,0 +1,164 @@
+import os
+import json
+from bisect import bisect_right
+
+
+# Champs qui changent à chaque passage sans que l'événement ait changé
+VOLATILE_FIELDS = ('last_updated',)
+
+
+def event_fingerprint(event):
+    """Contenu comparable d'un événement, sans les champs volatils"""
+    return {k: v for k, v in event.items() if k not in VOLATILE_FIELDS}
+
+
+class ChangeJournal:
+    """Journal append-only des changements du store d'événements.
+
+    Chaque ligne est {"seq", "op", "user_email", "id", "event"} avec op valant
+    "upsert" ou "delete". Le dernier seq sert de version (ETag) au store.
+
+    Les changements sont d'abord écrits dans <journal>.pending par prepare(),
+    avant les shards, puis ajoutés au journal par commit_pending() : un crash
+    entre les deux est rattrapé au prochain commit_pending().
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.pending_path = path + '.pending'
+        self.max_entries = max_entries
+        self._entries = None
+        self._mtime = None
+
+    def entries(self):
+        """Charge le journal, relu uniquement si le fichier a changé"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        if self._entries is None or mtime != self._mtime:
+            entries = []
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # Ligne tronquée par un crash pendant l'écriture
+                        continue
+            self._entries = entries
+            self._mtime = mtime
+        return self._entries
+
+    @property
+    def version(self):
+        entries = self.entries()
+        return entries[-1]['seq'] if entries else 0
+
+    @property
+    def first_seq(self):
+        entries = self.entries()
+        return entries[0]['seq'] if entries else 0
+
+    def diff(self, old_store, new_store):
+        """Liste des changements entre deux versions {user_email: {'events': [...]}}"""
+        changes = []
+        for user_email in set(old_store) | set(new_store):
+            old_events = {e['id']: e for e in old_store.get(user_email, {}).get('events', [])}
+            new_events = {e['id']: e for e in new_store.get(user_email, {}).get('events', [])}
+
+            for event_id, event in new_events.items():
+                old = old_events.get(event_id)
+                if old is None or event_fingerprint(old) != event_fingerprint(event):
+                    changes.append(('upsert', user_email, event_id, event))
+
+            for event_id in old_events.keys() - new_events.keys():
+                changes.append(('delete', user_email, event_id, None))
+        return changes
+
+    def append(self, changes):
+        """Ajoute les changements au journal et retourne la nouvelle version"""
+        seq = self.version
+        if not changes:
+            return seq
+
+        lines = []
+        for op, user_email, event_id, event in changes:
+            seq += 1
+            lines.append(json.dumps({
+                'seq': seq,
+                'op': op,
+                'user_email': user_email,
+                'id': event_id,
+                'event': event
+            }, ensure_ascii=False) + '\n')
+
+        with open(self.path, 'a+b') as f:
+            # Une ligne tronquée par un crash ne doit pas absorber la suivante
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    lines.insert(0, '\n')
+            f.write(''.join(lines).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+
+        if len(self.entries()) > self.max_entries:
+            self._truncate()
+        return seq
+
+    def prepare(self, changes):
+        """Écrit durablement les changements à journaliser, avant de modifier les shards"""
+        pending = {'base': self.version, 'changes': changes}
+        tmp_path = self.pending_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(pending, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pending_path)
+
+    def commit_pending(self):
+        """Ajoute au journal les changements préparés qui n'y sont pas encore et retourne la version"""
+        try:
+            with open(self.pending_path, 'r', encoding='utf-8') as f:
+                pending = json.load(f)
+        except FileNotFoundError:
+            return self.version
+
+        changes = [tuple(change) for change in pending['changes']]
+        # Un crash pendant append() a pu en écrire une partie : seq base + 1 + i pour le i-ème
+        done = min(len(changes), max(0, self.version - pending['base']))
+        if done:
+            print(f"Reprise du journal : {len(changes) - done} changement(s) sur {len(changes)} restant(s)")
+        version = self.append(changes[done:])
+        os.remove(self.pending_path)
+        return version
+
+    def _truncate(self):
+        """Ne garde que les max_entries derniers changements"""
+        kept = self.entries()[-self.max_entries:]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in kept:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def changes_since(self, cursor):
+        """Changements après cursor, fusionnés par événement.
+
+        Retourne None si le curseur est trop ancien (journal tronqué) et qu'il
+        faut repartir d'un snapshot complet.
+        """
+        entries = self.entries()
+        if not entries:
+            return [] if cursor == 0 else None
+        if cursor < self.first_seq - 1 or cursor > self.version:
+            return None
+
+        # Les seq sont triés, on saute directement au premier changement utile
+        latest = {}
+        for entry in entries[bisect_right(entries, cursor, key=lambda e: e['seq']):]:
+            latest[(entry['user_email'], entry['id'])] = entry
+        return list(latest.values())
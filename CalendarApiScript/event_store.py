@@ -0,0 +1,217 @@
+import os
+import json
+import hashlib
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from change_journal import event_fingerprint
+
+
+def parse_event_time(value, timezone):
+    """Date ISO d'un événement en datetime avec fuseau (journée entière : minuit local)"""
+    if 'T' in value:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return timezone.localize(datetime.strptime(value, '%Y-%m-%d'))
+
+
+def event_timestamps(event, timezone):
+    """Début et fin en secondes epoch UTC, calculés une fois au nettoyage (start_ts/end_ts)"""
+    start_ts = event.get('start_ts')
+    end_ts = event.get('end_ts')
+    # Anciens événements stockés sans les champs epoch
+    if start_ts is None:
+        start_ts = parse_event_time(event['start'], timezone).timestamp()
+    if end_ts is None:
+        end_ts = parse_event_time(event['end'], timezone).timestamp()
+    return start_ts, end_ts
+
+
+def write_atomic(path, data):
+    """Écrit un JSON dans un fichier temporaire puis le renomme : jamais de fichier à moitié écrit"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class EventStore:
+    """Store d'événements découpé en un fichier (shard) par utilisateur.
+
+    users/<email>.json contient {'last_update', 'events'} d'un utilisateur et
+    index.json garde pour chaque shard son hash et ses bornes temporelles :
+    on ne réécrit que les shards modifiés. Les requêtes par fenêtre de temps
+    passent par la timeline, construite une fois par version de l'index : la
+    liste de tous les événements triée par début, plus un arbre de segments
+    des fins maximales. « Commence dans la fenêtre » coûte O(log n + k) et
+    « recoupe la fenêtre » O((k + 1) log n), même avec de très longs
+    événements.
+    """
+
+    def __init__(self, base_dir, timezone):
+        self.base_dir = base_dir
+        self.timezone = timezone
+        self.SHARDS_DIR = os.path.join(base_dir, "users")
+        self.INDEX_FILE = os.path.join(base_dir, "index.json")
+        self._index = None
+        self._index_mtime = None
+        # (mtime de l'index, entrées (start_ts, end_ts, email, événement), débuts, arbre des fins max)
+        self._timeline = None
+        os.makedirs(self.SHARDS_DIR, exist_ok=True)
+
+    def shard_path(self, user_email):
+        return os.path.join(self.SHARDS_DIR, f"{user_email}.json")
+
+    def index(self):
+        """Index des shards, relu seulement quand le fichier change"""
+        try:
+            mtime = os.stat(self.INDEX_FILE).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._index is None or mtime != self._index_mtime:
+            with open(self.INDEX_FILE, 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+        return self._index
+
+    def users(self):
+        return list(self.index())
+
+    @staticmethod
+    def content_hash(events):
+        """Hash du contenu des événements, sans les champs volatils"""
+        content = json.dumps([event_fingerprint(e) for e in events], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def has_changed(self, user_email, events):
+        entry = self.index().get(user_email)
+        return entry is None or entry['hash'] != self.content_hash(events)
+
+    def read_user(self, user_email):
+        """Événements d'un seul utilisateur, sans lire les autres shards"""
+        try:
+            with open(self.shard_path(user_email), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load_all(self):
+        """Tous les shards, au format de l'ancien all_events.json"""
+        all_events = {}
+        for user_email in self.users():
+            data = self.read_user(user_email)
+            if data is not None:
+                all_events[user_email] = data
+        return all_events
+
+    def write_users(self, users_data):
+        """Réécrit les shards {user_email: data} modifiés puis l'index, retourne les emails écrits"""
+        index = dict(self.index())
+        written = []
+        for user_email, data in users_data.items():
+            events = data.get('events', [])
+            content_hash = self.content_hash(events)
+            if user_email in index and index[user_email]['hash'] == content_hash:
+                continue
+
+            write_atomic(self.shard_path(user_email), data)
+            bounds = [event_timestamps(e, self.timezone) for e in events]
+            starts = [start for start, _ in bounds]
+            ends = [end for _, end in bounds]
+            index[user_email] = {
+                'hash': content_hash,
+                'last_update': data.get('last_update'),
+                'count': len(events),
+                'min_start': min(starts) if starts else None,
+                'max_end': max(ends) if ends else None
+            }
+            written.append(user_email)
+
+        if written:
+            timeline = self._timeline
+            write_atomic(self.INDEX_FILE, index)
+            self._index = index
+            self._index_mtime = os.stat(self.INDEX_FILE).st_mtime_ns
+            # Timeline déjà construite : on remplace seulement les utilisateurs réécrits
+            if timeline is not None:
+                changed = set(written)
+                entries = [entry for entry in timeline[1] if entry[2] not in changed]
+                for user_email in written:
+                    entries.extend(self.timeline_entries(user_email, users_data[user_email].get('events', [])))
+                self._timeline = self.build_timeline(entries, self._index_mtime)
+        return written
+
+    def timeline_entries(self, user_email, events):
+        return [event_timestamps(event, self.timezone) + (user_email, event) for event in events]
+
+    @staticmethod
+    def build_timeline(entries, mtime):
+        # Tri stable sur (début, fin) : les dicts d'événements ne sont jamais comparés
+        entries.sort(key=lambda entry: (entry[0], entry[1]))
+        starts = [entry[0] for entry in entries]
+        # Arbre de segments implicite : la feuille size + i porte la fin de l'entrée i,
+        # chaque noeud la fin maximale de son sous-arbre
+        size = 1
+        while size < len(entries):
+            size *= 2
+        max_ends = [float('-inf')] * (2 * size)
+        max_ends[size:size + len(entries)] = [entry[1] for entry in entries]
+        for node in range(size - 1, 0, -1):
+            max_ends[node] = max(max_ends[2 * node], max_ends[2 * node + 1])
+        return (mtime, entries, starts, max_ends)
+
+    @staticmethod
+    def ending_after(max_ends, count, start_ts):
+        """Indices < count (par début croissant) des entrées qui finissent à start_ts ou après"""
+        size = len(max_ends) // 2
+        found = []
+        # Les sous-arbres qui finissent tous avant start_ts ne sont pas visités
+        stack = [(1, 0, size)]
+        while stack:
+            node, low, high = stack.pop()
+            if low >= count or max_ends[node] < start_ts:
+                continue
+            if node >= size:
+                found.append(node - size)
+                continue
+            middle = (low + high) // 2
+            stack.append((2 * node + 1, middle, high))
+            stack.append((2 * node, low, middle))
+        return found
+
+    def timeline(self):
+        """Timeline de tous les utilisateurs, reconstruite quand l'index change"""
+        index = self.index()
+        timeline = self._timeline
+        if timeline is None or timeline[0] != self._index_mtime:
+            entries = []
+            for user_email in index:
+                data = self.read_user(user_email) or {}
+                entries.extend(self.timeline_entries(user_email, data.get('events', [])))
+            timeline = self._timeline = self.build_timeline(entries, self._index_mtime)
+        return timeline
+
+    def starting_between(self, start_ts, end_ts):
+        """Événements qui commencent dans [start_ts, end_ts[ (epoch), triés par début"""
+        _, entries, starts, _ = self.timeline()
+        low, high = bisect_left(starts, start_ts), bisect_left(starts, end_ts)
+        return [dict(event, user_email=user_email) for _, _, user_email, event in entries[low:high]]
+
+    def events_between(self, start_ts, end_ts):
+        """Événements de tous les utilisateurs qui recoupent [start_ts, end_ts] (epoch), triés par début"""
+        _, entries, starts, max_ends = self.timeline()
+        # Candidats : commencés avant la fin de la fenêtre, puis l'arbre trouve ceux qui finissent après son début
+        high = bisect_right(starts, end_ts)
+        found = []
+        for index in self.ending_after(max_ends, high, start_ts):
+            _, _, user_email, event = entries[index]
+            found.append(dict(event, user_email=user_email))
+        return found
+
+    def import_legacy(self, legacy_file):
+        """Découpe un ancien all_events.json en shards si le store est vide"""
+        if self.index() or not os.path.exists(legacy_file):
+            return
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            self.write_users(json.load(f))
+        print(f"{legacy_file} importé dans le store par utilisateur")
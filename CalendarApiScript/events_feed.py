@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+import time
+from flask import request, Response
+from metrics import render_prometheus
+
+class EventsFeed:
+    """Flux des événements pour le scheduler SMS, complet ou incrémental.
+
+    GET /api/events renvoie {"cursor", "full", "events", "deleted"}.
+    Avec ?since=<cursor> seuls les événements ajoutés/modifiés/supprimés depuis
+    ce curseur sont envoyés, et If-None-Match sur l'ETag renvoie un 304.
+
+    GET /api/events/upcoming?minutes=N : événements qui commencent dans les N
+    prochaines minutes. GET /api/events/range?from=<epoch>&to=<epoch> :
+    événements qui recoupent la fenêtre. Les deux sont triés par start_ts.
+    """
+
+    # Fenêtre maximale des requêtes par plage de temps
+    MAX_WINDOW_SECONDS = 90 * 86400
+
+    def __init__(self, app, tasks):
+        self.app = app
+        self.tasks = tasks
+        self.setup_feed_routes()
+
+    def snapshot(self):
+        """Tous les événements stockés, à plat avec l'email de l'utilisateur"""
+        events = []
+        for user_email, data in self.tasks.load_stored_events().items():
+            for event in data.get('events', []):
+                events.append(dict(event, user_email=user_email))
+        return events
+
+    def build_response(self, body, etag):
+        """Réponse JSON, compressée en gzip si le client l'accepte"""
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            payload = gzip.compress(payload, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+
+        return Response(payload, status=200, headers=headers, mimetype='application/json')
+
+    def setup_feed_routes(self):
+        """Configure la route du flux d'événements"""
+        @self.app.route("/api/events")
+        def events_feed():
+            version = self.tasks.journal.version
+            etag = f'"{version}"'
+
+            if request.headers.get('If-None-Match') == etag:
+                return Response(status=304, headers={'ETag': etag})
+
+            since = request.args.get('since', type=int)
+            changes = self.tasks.journal.changes_since(since) if since is not None else None
+
+            # Curseur absent, trop ancien ou inconnu : snapshot complet
+            if changes is None:
+                body = {'cursor': version, 'full': True, 'events': self.snapshot(), 'deleted': []}
+            else:
+                body = {
+                    'cursor': version,
+                    'full': False,
+                    'events': [
+                        dict(change['event'], user_email=change['user_email'])
+                        for change in changes if change['op'] == 'upsert'
+                    ],
+                    'deleted': [
+                        {'id': change['id'], 'user_email': change['user_email']}
+                        for change in changes if change['op'] == 'delete'
+                    ]
+                }
+
+            return self.build_response(body, etag)
+
+        @self.app.route("/api/events/upcoming")
+        def upcoming_events():
+            minutes = request.args.get('minutes', default=60, type=float)
+            if not 0 < minutes * 60 <= self.MAX_WINDOW_SECONDS:
+                return {'error': 'minutes hors limites'}, 400
+            now = time.time()
+            end = now + minutes * 60
+            events = self.tasks.store.starting_between(now, end)
+            return self.build_response({'from': now, 'to': end, 'events': events}, f'"{self.tasks.journal.version}"')
+
+        @self.app.route("/api/events/range")
+        def events_in_range():
+            start = request.args.get('from', type=float)
+            end = request.args.get('to', type=float)
+            if start is None or end is None or not 0 <= end - start <= self.MAX_WINDOW_SECONDS:
+                return {'error': 'from et to (epoch) requis, fenêtre de 90 jours au plus'}, 400
+            events = self.tasks.store.events_between(start, end)
+            return self.build_response({'from': start, 'to': end, 'events': events}, f'"{self.tasks.journal.version}"')
+
+        @self.app.route("/metrics")
+        def metrics():
+            # Métriques du dernier passage de la tâche planifiée (autre processus)
+            if not os.path.exists(self.tasks.METRICS_FILE):
+                return Response(status=404)
+            with open(self.tasks.METRICS_FILE, 'r') as f:
+                snapshot = json.load(f)
+            return Response(render_prometheus(snapshot), content_type='text/plain; version=0.0.4; charset=utf-8')
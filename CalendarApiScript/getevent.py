@@ -1,17 +1,41 @@
 import os
 import json
-import pickle
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from urllib.parse import urljoin
 import pytz
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+from change_journal import ChangeJournal
+from keywords import KeywordConfig
+from event_store import EventStore, event_timestamps, parse_event_time
+from token_store import TokenStore
+from google_services import build_service
+from metrics import REGISTRY, tracer
+
+user_fetch_seconds = REGISTRY.histogram("calendar_user_fetch_seconds", "Durée de synchro d'un utilisateur")
+api_calls = REGISTRY.counter("calendar_api_calls_total", "Requêtes Calendar API envoyées dans les batchs")
+api_errors = REGISTRY.counter("calendar_api_errors_total", "Erreurs Calendar API par code HTTP")
+user_errors = REGISTRY.counter("calendar_user_errors_total", "Utilisateurs non synchronisés, par raison")
+sync_runs = REGISTRY.counter("calendar_syncs_total", "Synchros de calendrier, complètes ou incrémentales")
 
 class CalendarBackgroundTasks:
     def __init__(self):
-        self.TOKEN_DIR = "/home/sciproject/mysite/tokens"
-        self.EVENTS_DIR = "/home/sciproject/mysite/events"
+        self.TOKEN_DIR = os.environ.get('TOKEN_DIR', "/home/sciproject/mysite/tokens")
+        self.token_store = TokenStore(self.TOKEN_DIR)
+        self.EVENTS_DIR = os.environ.get('EVENTS_DIR', "/home/sciproject/mysite/events")
+        # Ancien fichier unique, importé une fois dans le store par utilisateur
         self.EVENTS_FILE = os.path.join(self.EVENTS_DIR, "all_events.json")
+        self.JOURNAL_FILE = os.path.join(self.EVENTS_DIR, "events_journal.jsonl")
+        # syncToken et événements connus par (utilisateur, calendrier)
+        self.SYNC_DIR = os.path.join(self.EVENTS_DIR, "sync_state")
+        self.journal = ChangeJournal(self.JOURNAL_FILE)
+        # Changements écrits dans les shards mais pas encore journalisés (crash, disque plein)
+        self.journal.commit_pending()
         self.TIMEZONE = pytz.timezone('Europe/Paris')
+        self.store = EventStore(self.EVENTS_DIR, self.TIMEZONE)
+        self.store.import_legacy(self.EVENTS_FILE)
         
         # Mots-clés pour filtrer les événements pertinents
         self.KEYWORDS = [
@@ -19,141 +43,334 @@ class CalendarBackgroundTasks:
             "Reunion", "session", "meet", "à remettre", "Test", "interrogation",
             "Démonstration", "obligatoire", "Présentation", "Demo", "interro", "à rendre"
         ]
+        # Listes supplémentaires par utilisateur / calendrier, compilées une seule fois
+        self.keyword_config = KeywordConfig(self.KEYWORDS, os.environ.get('KEYWORDS_FILE'))
         
         # Période pour chercher les événements (7 jours dans le futur par défaut)
         self.LOOKUP_DAYS = 7
+        # Horizon de la synchro complète, refaite tous les FULL_SYNC_DAYS jours
+        # pour rattraper les événements qui entrent dans l'horizon sans changer
+        self.SYNC_HORIZON_DAYS = 90
+        self.FULL_SYNC_DAYS = 30
+
+        # Nombre d'utilisateurs traités en parallèle
+        self.MAX_WORKERS = int(os.environ.get('CALENDAR_FETCH_WORKERS', 8))
+        # Google accepte au plus 50 requêtes par batch
+        self.BATCH_SIZE = 50
+        # Permet de viser un faux serveur Calendar en local (ex. http://127.0.0.1:8090/calendar/v3/)
+        self.API_ENDPOINT = os.environ.get('CALENDAR_API_ENDPOINT')
+        self.BATCH_URI = urljoin(self.API_ENDPOINT or 'https://www.googleapis.com', '/batch/calendar/v3')
+
+        # Snapshot des métriques du dernier passage, exposé par EventsFeed sur /metrics
+        self.METRICS_FILE = os.environ.get('METRICS_PATH', os.path.join(self.EVENTS_DIR, "metrics.json"))
+        # Durée au-delà de laquelle le détail des phases est affiché
+        self.RUN_BUDGET_SECONDS = int(os.environ.get('CALENDAR_RUN_BUDGET', 120))
 
     def load_stored_events(self):
-        """Charge les événements stockés"""
-        if os.path.exists(self.EVENTS_FILE):
-            with open(self.EVENTS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        """Charge les événements stockés de tous les utilisateurs"""
+        return self.store.load_all()
 
     def save_events(self, events_data):
-        """Sauvegarde les événements"""
-        with open(self.EVENTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(events_data, f, ensure_ascii=False, indent=4)
+        """Sauvegarde les événements {user_email: data} et journalise ce qui a changé"""
+        # Un enregistrement précédent a pu échouer après l'écriture des shards
+        self.journal.commit_pending()
 
-    def get_user_credentials(self, token_file):
-        """Récupère les credentials d'un utilisateur"""
-        try:
-            with open(token_file, 'rb') as token:
-                return pickle.load(token)
-        except Exception as e:
-            print(f"Erreur de chargement du token: {str(e)}")
-            return None
+        # Seuls les utilisateurs dont le contenu a changé sont relus et réécrits
+        changed = {
+            user_email: data for user_email, data in events_data.items()
+            if self.store.has_changed(user_email, data['events'])
+        }
+        old_data = {user_email: self.store.read_user(user_email) or {} for user_email in changed}
 
-    def is_relevant_event(self, event):
-        """Vérifie si l'événement est pertinent selon les mots-clés"""
-        title = event.get('summary', '').lower()
-        description = event.get('description', '').lower() if event.get('description') else ''
-        
-        return any(keyword.lower() in title or keyword.lower() in description 
-                  for keyword in self.KEYWORDS)
+        # Les changements sont mis de côté durablement, puis les shards écrits, puis
+        # le journal : un snapshot lu à la version N contient au moins les changements
+        # jusqu'à N (un delta peut renvoyer un événement déjà reçu, sans effet), et
+        # si le journal échoue après les shards, commit_pending() le rattrape.
+        changes = self.journal.diff(old_data, changed)
+        if changes:
+            self.journal.prepare(changes)
+        self.store.write_users(changed)
+        version = self.journal.commit_pending()
+        print(f"{len(changed)} utilisateur(s) modifié(s), {len(changes)} changement(s), "
+              f"version du store : {version}")
 
-    def clean_event(self, event):
+    def is_relevant_event(self, event, user_email=None):
+        """Retourne le mot-clé qui rend l'événement pertinent, sinon None"""
+        matcher = self.keyword_config.matcher_for(user_email, event.get('calendarId'))
+        return matcher.match(event.get('summary'), event.get('description'))
+
+    def clean_event(self, event, user_email=None):
         """Nettoie et formate un événement"""
-        if not self.is_relevant_event(event):
+        keyword = self.is_relevant_event(event, user_email)
+        if not keyword:
             return None
 
         start = event.get('start', {})
         end = event.get('end', {})
-        
+        start_value = start.get('dateTime') or start.get('date')
+        end_value = end.get('dateTime') or end.get('date')
+
         return {
             'id': event.get('id'),
             'title': event.get('summary', 'Sans titre'),
-            'start': start.get('dateTime') or start.get('date'),
-            'end': end.get('dateTime') or end.get('date'),
+            'start': start_value,
+            'end': end_value,
+            # Epoch UTC, les journées entières commencent à minuit heure de Paris
+            'start_ts': parse_event_time(start_value, self.TIMEZONE).timestamp(),
+            'end_ts': parse_event_time(end_value, self.TIMEZONE).timestamp(),
+            'all_day': 'dateTime' not in start,
             'description': event.get('description'),
             'calendar_id': event.get('calendarId'),
             'calendar_name': event.get('calendarName', 'Calendrier principal'),
+            'keyword': keyword,
             'last_updated': datetime.now(self.TIMEZONE).isoformat()
         }
 
+    def build_service(self, credentials):
+        """Crée le client Calendar d'un utilisateur (discovery déjà en mémoire)"""
+        return build_service('calendar', 'v3', credentials, self.API_ENDPOINT)
+
+    def event_bounds(self, event):
+        """Début et fin d'un événement nettoyé en secondes epoch"""
+        return event_timestamps(event, self.TIMEZONE)
+
+    def sync_state_path(self, user_email):
+        return os.path.join(self.SYNC_DIR, f"{user_email}.json")
+
+    def load_sync_state(self, user_email):
+        """Charge l'état de synchronisation d'un utilisateur"""
+        path = self.sync_state_path(user_email)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except ValueError:
+                print(f"État de synchro illisible pour {user_email}, resynchronisation complète")
+        return {}
+
+    def save_sync_state(self, user_email, state):
+        """Sauvegarde l'état de synchronisation (écriture atomique)"""
+        os.makedirs(self.SYNC_DIR, exist_ok=True)
+        path = self.sync_state_path(user_email)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def list_calendars(self, service):
+        """Liste tous les calendriers de l'utilisateur, page par page"""
+        calendars = []
+        page_token = None
+        while True:
+            calendar_list = service.calendarList().list(pageToken=page_token).execute()
+            calendars.extend(calendar_list.get('items', []))
+            page_token = calendar_list.get('nextPageToken')
+            if not page_token:
+                return calendars
+
+    def merge_events(self, user_email, calendar, calendar_state, items):
+        """Applique une page de changements aux événements connus d'un calendrier"""
+        known = calendar_state['events']
+        for event in items:
+            # Événement supprimé (ou plus pertinent) : on l'oublie
+            if event.get('status') == 'cancelled':
+                known.pop(event['id'], None)
+                continue
+
+            event['calendarId'] = calendar['id']
+            event['calendarName'] = calendar.get('summary', 'Calendrier inconnu')
+            cleaned_event = self.clean_event(event, user_email)
+            if cleaned_event:
+                known[event['id']] = cleaned_event
+            else:
+                known.pop(event['id'], None)
+
     def process_user_events(self, user_email, credentials):
-        """Traite les événements d'un utilisateur"""
+        """Synchronise les calendriers d'un utilisateur et retourne ses événements à venir.
+
+        Le premier passage liste les SYNC_HORIZON_DAYS à venir puis garde le
+        nextSyncToken ; les passages suivants ne demandent que les changements.
+        Un 410 Gone invalide le token et relance une synchro complète.
+        """
         try:
-            service = build('calendar', 'v3', credentials=credentials)
+            service = self.build_service(credentials)
             
             # Calcul des dates de début et fin
             now = datetime.now(self.TIMEZONE)
             end_date = now + timedelta(days=self.LOOKUP_DAYS)
             
             # Récupération des calendriers de l'utilisateur
-            calendar_list = service.calendarList().list().execute()
-            calendars = calendar_list.get('items', [])
-            
-            all_events = []
-            for calendar in calendars:
-                try:
-                    events_result = service.events().list(
-                        calendarId=calendar['id'],
-                        timeMin=now.isoformat(),
-                        timeMax=end_date.isoformat(),
+            calendars = self.list_calendars(service)
+            old_state = self.load_sync_state(user_email)
+
+            def initial_state(calendar_id):
+                previous = old_state.get(calendar_id)
+                if not previous or not previous.get('sync_token'):
+                    return {'sync_token': None, 'full_sync_at': now.timestamp(), 'events': {}}
+                if now.timestamp() - previous['full_sync_at'] > self.FULL_SYNC_DAYS * 86400:
+                    return {'sync_token': None, 'full_sync_at': now.timestamp(), 'events': {}}
+                return {
+                    'sync_token': previous['sync_token'],
+                    'full_sync_at': previous['full_sync_at'],
+                    'events': dict(previous['events'])
+                }
+
+            # Les calendriers disparus de la liste sont oubliés
+            state = {calendar['id']: initial_state(calendar['id']) for calendar in calendars}
+
+            # File de requêtes (index du calendrier, pageToken), traitée par batchs
+            pending = [(index, None) for index in range(len(calendars))]
+
+            def list_request(index, page_token):
+                calendar_state = state[calendars[index]['id']]
+                if calendar_state['sync_token']:
+                    return service.events().list(
+                        calendarId=calendars[index]['id'],
+                        syncToken=calendar_state['sync_token'],
                         singleEvents=True,
-                        orderBy='startTime'
-                    ).execute()
-                    
-                    # Ajoute les informations du calendrier à chaque événement
-                    events = events_result.get('items', [])
-                    for event in events:
-                        event['calendarId'] = calendar['id']
-                        event['calendarName'] = calendar.get('summary', 'Calendrier inconnu')
-                        
-                    all_events.extend(events)
-                    
-                except Exception as e:
-                    print(f"Erreur pour le calendrier {calendar['id']}: {str(e)}")
-                    continue
-            
-            return all_events
+                        pageToken=page_token
+                    )
+                return service.events().list(
+                    calendarId=calendars[index]['id'],
+                    timeMin=now.isoformat(),
+                    timeMax=(now + timedelta(days=self.SYNC_HORIZON_DAYS)).isoformat(),
+                    singleEvents=True,
+                    pageToken=page_token
+                )
+
+            while pending:
+                batch_requests, pending = pending[:self.BATCH_SIZE], pending[self.BATCH_SIZE:]
+
+                def on_response(request_id, response, exception):
+                    index = int(request_id)
+                    calendar = calendars[index]
+                    calendar_state = state[calendar['id']]
+
+                    if isinstance(exception, HttpError):
+                        api_errors.inc(status=exception.resp.status)
+                    elif exception is not None:
+                        api_errors.inc(status="network")
+
+                    if isinstance(exception, HttpError) and exception.resp.status == 410:
+                        print(f"syncToken expiré pour le calendrier {calendar['id']}, synchro complète")
+                        calendar_state.update(sync_token=None, full_sync_at=now.timestamp(), events={})
+                        pending.append((index, None))
+                        return
+                    if exception is not None:
+                        print(f"Erreur pour le calendrier {calendar['id']}: {str(exception)}")
+                        # On garde l'ancien état pour réessayer au prochain passage
+                        if calendar['id'] in old_state:
+                            state[calendar['id']] = old_state[calendar['id']]
+                        else:
+                            calendar_state.update(sync_token=None, events={})
+                        return
+
+                    self.merge_events(user_email, calendar, calendar_state, response.get('items', []))
+                    if response.get('nextPageToken'):
+                        pending.append((index, response['nextPageToken']))
+                    elif response.get('nextSyncToken'):
+                        calendar_state['sync_token'] = response['nextSyncToken']
+
+                # Un seul aller-retour HTTP par paquet de 50 requêtes
+                batch = BatchHttpRequest(callback=on_response, batch_uri=self.BATCH_URI)
+                for index, page_token in batch_requests:
+                    if page_token is None:
+                        sync_runs.inc(kind="incremental" if state[calendars[index]['id']]['sync_token'] else "full")
+                    batch.add(list_request(index, page_token), request_id=str(index))
+                api_calls.inc(len(batch_requests))
+                batch.execute()
+
+            # On oublie les événements terminés et on garde la fenêtre de LOOKUP_DAYS
+            all_events = []
+            for calendar_state in state.values():
+                for event_id, event in list(calendar_state['events'].items()):
+                    start, end = self.event_bounds(event)
+                    # Événements gardés en cache avant l'ajout des champs epoch
+                    event.setdefault('start_ts', start)
+                    event.setdefault('end_ts', end)
+                    if end < now.timestamp():
+                        del calendar_state['events'][event_id]
+                    elif start <= end_date.timestamp():
+                        all_events.append((start, event))
+
+            self.save_sync_state(user_email, state)
+            all_events.sort(key=lambda item: item[0])
+            return [event for _, event in all_events]
             
         except Exception as e:
+            user_errors.inc(reason="exception")
             print(f"Erreur de traitement pour {user_email}: {str(e)}")
-            return []
+            return None
+
+    def fetch_user_events(self, user_email):
+        """Récupère les événements à venir d'un utilisateur (exécuté dans un thread)"""
+        # Les tokens expirés sont rafraîchis au lieu d'être ignorés
+        credentials = self.token_store.get(user_email, wait=True)
+        if not credentials or not credentials.valid:
+            user_errors.inc(reason="token")
+            print(f"Token invalide pour {user_email}")
+            return None
+
+        with user_fetch_seconds.time():
+            return self.process_user_events(user_email, credentials)
 
     def update_events(self):
         """Met à jour les événements pour tous les utilisateurs"""
-        all_stored_events = self.load_stored_events()
+        with tracer.trace("calendar_sync", budget=self.RUN_BUDGET_SECONDS):
+            self.sync_all_users()
+
+        try:
+            REGISTRY.dump_json(self.METRICS_FILE, traces=list(tracer.traces))
+        except OSError as e:
+            print(f"Impossible d'écrire les métriques : {str(e)}")
+
+    def sync_all_users(self):
+        """Synchronise tous les utilisateurs qui ont un token et sauvegarde le résultat"""
+        known_users = set(self.store.users())
+        updated_events = {}
         
         # Parcours des tokens utilisateurs
-        for filename in os.listdir(self.TOKEN_DIR):
-            if filename.endswith('.pickle'):
-                user_email = filename[:-7]  # Retire '.pickle'
-                token_path = os.path.join(self.TOKEN_DIR, filename)
-                
-                credentials = self.get_user_credentials(token_path)
-                if not credentials or not credentials.valid:
-                    print(f"Token invalide pour {user_email}")
+        users = [
+            filename[:-7]  # Retire '.pickle'
+            for filename in os.listdir(self.TOKEN_DIR)
+            if filename.endswith('.pickle')
+        ]
+
+        # Les utilisateurs sont traités en parallèle, une erreur n'affecte que son utilisateur
+        with tracer.span("fetch_users"), ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(self.fetch_user_events, user_email): user_email
+                for user_email in users
+            }
+
+            for future in as_completed(futures):
+                user_email = futures[future]
+                try:
+                    cleaned_events = future.result()
+                except Exception as e:
+                    print(f"Erreur de traitement pour {user_email}: {str(e)}")
                     continue
-                
-                # Récupération et traitement des événements
-                raw_events = self.process_user_events(user_email, credentials)
-                
-                # Nettoyage et filtrage des événements
-                cleaned_events = []
-                for event in raw_events:
-                    cleaned_event = self.clean_event(event)
-                    if cleaned_event:
-                        cleaned_events.append(cleaned_event)
-                
+
+                if cleaned_events is None:
+                    continue
+
                 # Mise à jour des événements stockés
                 if cleaned_events:
-                    all_stored_events[user_email] = {
+                    updated_events[user_email] = {
                         'last_update': datetime.now(self.TIMEZONE).isoformat(),
                         'events': cleaned_events
                     }
-                elif user_email in all_stored_events:
+                elif user_email in known_users:
                     # Si pas d'événements pertinents, on peut soit supprimer l'entrée
                     # soit garder une entrée vide avec la date de dernière mise à jour
-                    all_stored_events[user_email] = {
+                    updated_events[user_email] = {
                         'last_update': datetime.now(self.TIMEZONE).isoformat(),
                         'events': []
                     }
         
         # Sauvegarde des mises à jour
-        self.save_events(all_stored_events)
+        with tracer.span("save_events"):
+            self.save_events(updated_events)
         print("Mise à jour des événements terminée")
 
 def main():
@@ -0,0 +1,35 @@
+import os
+import json
+from functools import lru_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+
+# Dossier optionnel de documents de discovery ({api}.{version}.json), prioritaire
+DISCOVERY_CACHE_DIR = os.environ.get('DISCOVERY_CACHE_DIR')
+
+
+@lru_cache(maxsize=None)
+def discovery_document(api, version):
+    """Document de discovery parsé une seule fois par process, sans appel réseau"""
+    if DISCOVERY_CACHE_DIR:
+        path = os.path.join(DISCOVERY_CACHE_DIR, f"{api}.{version}.json")
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    # Documents embarqués dans google-api-python-client
+    content = get_static_doc(api, version)
+    if content is None:
+        raise RuntimeError(f"Pas de document de discovery local pour {api} {version}")
+    return json.loads(content)
+
+
+def build_service(api, version, credentials, api_endpoint=None):
+    """Client d'API léger construit à partir du document de discovery partagé"""
+    client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+    return build_from_document(
+        discovery_document(api, version),
+        credentials=credentials,
+        client_options=client_options
+    )
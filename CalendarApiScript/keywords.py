@@ -0,0 +1,100 @@
+import os
+import re
+import json
+import unicodedata
+
+
+def normalize(text):
+    """Texte en minuscules, sans accents et avec les espaces regroupés"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.split())
+
+
+def _trie_pattern(node):
+    """Transforme un trie de mots en regex où les préfixes communs sont factorisés"""
+    alternatives = []
+    optional = False
+    for char in sorted(node):
+        if char == '':
+            optional = True
+        else:
+            alternatives.append(re.escape(char) + _trie_pattern(node[char]))
+
+    if not alternatives:
+        return ''
+    body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    if optional:
+        # Greedy : le mot le plus long gagne quand l'un est préfixe de l'autre
+        body = '(?:' + body + ')?'
+    return body
+
+
+class KeywordMatcher:
+    """Recherche de mots-clés compilée une fois, insensible à la casse et aux accents.
+
+    Les mots-clés sont rangés dans un trie puis compilés en une seule regex :
+    le coût par événement ne dépend presque pas du nombre de mots-clés.
+    Par défaut un mot-clé doit commencer un mot ("interro" trouve
+    "interrogation" mais pas "cinterro") ; whole_words exige aussi la fin du mot.
+    """
+
+    def __init__(self, keywords, whole_words=False):
+        self.keywords = list(keywords)
+        self.lookup = {}
+        for keyword in self.keywords:
+            self.lookup.setdefault(normalize(keyword), keyword)
+
+        trie = {}
+        for word in self.lookup:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        end = r'(?!\w)' if whole_words else ''
+        self.regex = re.compile(r'(?<!\w)' + _trie_pattern(trie) + end) if self.lookup else None
+
+    def match(self, *texts):
+        """Retourne le mot-clé (tel que configuré) trouvé dans un des textes, sinon None"""
+        if self.regex is None:
+            return None
+        for text in texts:
+            if not text:
+                continue
+            found = self.regex.search(normalize(text))
+            if found:
+                return self.lookup[found.group(0)]
+        return None
+
+
+class KeywordConfig:
+    """Listes de mots-clés par défaut, par utilisateur et par calendrier (cours).
+
+    Fichier JSON optionnel :
+    {"whole_words": false, "default": [...], "users": {email: [...]}, "calendars": {id: [...]}}
+    Les listes par utilisateur et par calendrier s'ajoutent à la liste par défaut.
+    """
+
+    def __init__(self, default_keywords, path=None):
+        config = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+
+        self.whole_words = config.get('whole_words', False)
+        self.default = config.get('default', default_keywords)
+        self.users = config.get('users', {})
+        self.calendars = config.get('calendars', {})
+        # Un matcher compilé par liste distincte
+        self._matchers = {}
+
+    def matcher_for(self, user_email=None, calendar_id=None):
+        keywords = list(self.default)
+        keywords += self.users.get(user_email, [])
+        keywords += self.calendars.get(calendar_id, [])
+
+        key = tuple(keywords)
+        if key not in self._matchers:
+            self._matchers[key] = KeywordMatcher(keywords, self.whole_words)
+        return self._matchers[key]
@@ -0,0 +1,176 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from google.auth.transport.requests import Request
+
+
+class TokenStore:
+    """Cache mémoire des credentials OAuth (<email>.pickle) avec rafraîchissement anticipé.
+
+    Les credentials sont gardés dans un LRU invalidé par le mtime du fichier :
+    une requête ne coûte plus qu'un stat(). Les tokens qui expirent dans moins
+    de REFRESH_MARGIN sont rafraîchis dans un pool de threads, un seul
+    rafraîchissement à la fois par utilisateur. Après un échec (token révoqué,
+    réseau), on ne réessaie pas avant RETRY_DELAY et un token qui n'est plus
+    valide est refusé, jusqu'à ce que le fichier change.
+    """
+
+    def __init__(self, token_dir, max_entries=256, refresh_margin=timedelta(minutes=5), workers=4,
+                 retry_delay=300):
+        self.TOKEN_DIR = token_dir
+        self.MAX_ENTRIES = max_entries
+        self.REFRESH_MARGIN = refresh_margin
+        self.RETRY_DELAY = retry_delay
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._user_locks = {}
+        self._refreshing = {}
+        # email -> (mtime du fichier, time.monotonic()) du dernier rafraîchissement raté
+        self._failures = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='token-refresh')
+
+    def token_path(self, user_email):
+        return os.path.join(self.TOKEN_DIR, f"{user_email}.pickle")
+
+    def _user_lock(self, user_email):
+        with self._lock:
+            return self._user_locks.setdefault(user_email, threading.Lock())
+
+    def _remember(self, user_email, mtime, credentials):
+        with self._lock:
+            # Nouveau fichier (autorisation ou rafraîchissement réussi) : l'échec est oublié
+            failure = self._failures.get(user_email)
+            if failure and failure[0] != mtime:
+                del self._failures[user_email]
+            self._cache[user_email] = (mtime, credentials)
+            self._cache.move_to_end(user_email)
+            while len(self._cache) > self.MAX_ENTRIES:
+                self._cache.popitem(last=False)
+
+    def load(self, user_email):
+        """Credentials depuis le cache, relus du disque seulement si le fichier a changé"""
+        path = self.token_path(user_email)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._cache.pop(user_email, None)
+                self._failures.pop(user_email, None)
+            return None
+
+        with self._lock:
+            cached = self._cache.get(user_email)
+            if cached and cached[0] == mtime:
+                self._cache.move_to_end(user_email)
+                return cached[1]
+
+        try:
+            with open(path, 'rb') as token_file:
+                credentials = pickle.load(token_file)
+        except Exception as e:
+            print(f"Erreur de chargement du token: {str(e)}")
+            return None
+
+        self._remember(user_email, mtime, credentials)
+        return credentials
+
+    def save(self, user_email, credentials):
+        """Écrit le token de façon atomique et met le cache à jour"""
+        path = self.token_path(user_email)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as token_file:
+            pickle.dump(credentials, token_file)
+        os.replace(tmp_path, path)
+        self._remember(user_email, os.stat(path).st_mtime_ns, credentials)
+
+    def needs_refresh(self, credentials):
+        if not credentials.refresh_token:
+            return False
+        if not credentials.expiry:
+            return not credentials.valid
+        # google-auth utilise des datetimes UTC naïfs pour expiry
+        return credentials.expiry - datetime.utcnow() < self.REFRESH_MARGIN
+
+    def _refresh(self, user_email):
+        with self._user_lock(user_email):
+            # Un autre thread (ou process) a pu rafraîchir le token entre temps
+            credentials = self.load(user_email)
+            if not credentials or not self.needs_refresh(credentials):
+                return credentials
+            try:
+                credentials.refresh(Request())
+                self.save(user_email, credentials)
+                print(f"Token rafraîchi pour {user_email}")
+            except Exception as e:
+                with self._lock:
+                    cached = self._cache.get(user_email)
+                    self._failures[user_email] = (cached[0] if cached else None, time.monotonic())
+                print(f"Erreur de rafraîchissement du token de {user_email}: {str(e)}")
+            return credentials
+
+    def refresh_failed(self, user_email):
+        """True si le dernier rafraîchissement des credentials actuels a échoué"""
+        with self._lock:
+            return user_email in self._failures
+
+    def _should_refresh(self, user_email, credentials):
+        if not self.needs_refresh(credentials):
+            return False
+        with self._lock:
+            failure = self._failures.get(user_email)
+        return failure is None or time.monotonic() - failure[1] >= self.RETRY_DELAY
+
+    def schedule_refresh(self, user_email):
+        """Lance le rafraîchissement en arrière-plan, sans doublon par utilisateur"""
+        with self._lock:
+            future = self._refreshing.get(user_email)
+            if future is None or future.done():
+                future = self._executor.submit(self._refresh, user_email)
+                self._refreshing[user_email] = future
+            return future
+
+    def get(self, user_email, wait=False):
+        """Credentials utilisables de l'utilisateur, ou None.
+
+        Un token expiré mais rafraîchissable est accepté et rafraîchi en
+        arrière-plan ; avec wait=True on attend la fin du rafraîchissement.
+        Un token expiré dont le rafraîchissement a échoué est refusé, pour
+        que l'utilisateur repasse par /authorize.
+        """
+        credentials = self.load(user_email)
+        if not credentials:
+            return None
+
+        if self._should_refresh(user_email, credentials):
+            future = self.schedule_refresh(user_email)
+            if wait:
+                credentials = future.result()
+
+        if not credentials:
+            return None
+        if credentials.valid:
+            return credentials
+        if credentials.refresh_token and not self.refresh_failed(user_email):
+            return credentials
+        return None
+
+    def refresh_expiring(self):
+        """Rafraîchit en arrière-plan tous les tokens en cache proches de l'expiration"""
+        with self._lock:
+            cached = list(self._cache.items())
+        for user_email, (_, credentials) in cached:
+            if self._should_refresh(user_email, credentials):
+                self.schedule_refresh(user_email)
+
+    def start_background_refresh(self, interval=60):
+        """Vérifie périodiquement les tokens en cache dans un thread démon"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.refresh_expiring()
+
+        threading.Thread(target=loop, name='token-refresh-loop', daemon=True).start()
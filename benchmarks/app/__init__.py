@@ -0,0 +1,20 @@
+"""Minimal stand-in for the web app package: Flask + SQLite User table.
+
+raspischeduler imports `app.db`, `app.models.User` and `app.create_app`;
+the benchmarks put this package first on sys.path instead of the real one.
+"""
+import os
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.environ['BENCH_DB_PATH']}"
+    db.init_app(app)
+    with app.app_context():
+        from app import models  # noqa: F401
+        db.create_all()
+    return app
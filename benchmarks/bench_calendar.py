@@ -0,0 +1,86 @@
+"""Benchmark CalendarBackgroundTasks.update_events against a fake Calendar API.
+
+    python benchmarks/bench_calendar.py --users 1 10 50 200 --calendars 5 \
+        --events-per-calendar 40 --latency 0.05 --workers 8 --runs 3
+
+The first run of each size is a full sync, the following ones are
+incremental (syncToken) runs. Each size runs in its own child process and
+prints one JSON line per kind of run.
+"""
+import argparse
+import contextlib
+import io
+import os
+import pickle
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def run_size(args):
+    from google.oauth2.credentials import Credentials
+    from fakes import FakeCalendarAPI
+    from harness import AuditCounter, report
+
+    tmp = tempfile.mkdtemp(prefix="bench-calendar-")
+    token_dir = os.path.join(tmp, "tokens")
+    os.makedirs(token_dir)
+    for i in range(args.users):
+        credentials = Credentials(token="fake-token", expiry=datetime.utcnow() + timedelta(hours=1))
+        with open(os.path.join(token_dir, f"student{i}@example.com.pickle"), "wb") as token_file:
+            pickle.dump(credentials, token_file)
+
+    api = FakeCalendarAPI(args.calendars, args.events_per_calendar, args.latency).start()
+    os.environ.update(
+        TOKEN_DIR=token_dir,
+        EVENTS_DIR=os.path.join(tmp, "events"),
+        CALENDAR_API_ENDPOINT=api.api_endpoint,
+        CALENDAR_FETCH_WORKERS=str(args.workers),
+    )
+    os.makedirs(os.environ["EVENTS_DIR"])
+    sys.path.insert(0, os.path.join(ROOT, "CalendarApiScript"))
+
+    from getevent import CalendarBackgroundTasks
+    tasks = CalendarBackgroundTasks()
+
+    params = {"users": args.users, "calendars": args.calendars,
+              "events_per_calendar": args.events_per_calendar,
+              "latency_s": args.latency, "workers": args.workers}
+    for kind, runs in (("full", 1), ("incremental", args.runs - 1)):
+        if runs < 1:
+            continue
+        audit = AuditCounter()
+        durations = []
+        calls_before = api.calls
+        with audit, contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(runs):
+                started = time.perf_counter()
+                tasks.update_events()
+                durations.append(time.perf_counter() - started)
+        result = report(f"calendar_update_{kind}", params, durations, args.users * runs, audit)
+        print(f"# {kind}: {api.calls - calls_before} Calendar API calls, "
+              f"{result['items_per_sec']} users/s", file=sys.stderr)
+    api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--calendars", type=int, default=5)
+    parser.add_argument("--events-per-calendar", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    from harness import run_sizes
+    run_sizes(__file__, args, "users", run_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark raspischeduler ticks against a fake feed, a fake RaspiSMS and SQLite.
+
+    python benchmarks/bench_scheduler.py --events 10 100 1000 10000 --users 200 \
+        --ticks 5 --sms-latency 0.02 --sms-failure-rate 0.01
+
+Every tick gets a fresh generation of events starting in 30 minutes, so all
+of them have a reminder due. Each size runs in its own child process so
+peak RSS and syscall counts belong to that size only. One JSON line is
+printed per size, followed by the cost of an idle (304) tick.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def run_size(args):
+    from fakes import FakeEventsFeed, FakeRaspiSMS
+    from harness import AuditCounter, report
+
+    tmp = tempfile.mkdtemp(prefix="bench-scheduler-")
+    users = [f"student{i}@example.com" for i in range(args.users)]
+    feed = FakeEventsFeed(args.events, users).start()
+    sms = FakeRaspiSMS(args.sms_latency, args.sms_failure_rate).start()
+
+    phones = [str(i + 1) for i in range(args.phones)]
+    os.environ.update(
+        GCURL=feed.url,
+        RASPISMSAPI="bench",
+        IDPHONE=phones[0],
+        IDPHONES=",".join(phones),
+        LOGPATH=os.path.join(tmp, "sent_sms.jsonl"),
+        BENCH_DB_PATH=os.path.join(tmp, "users.db"),
+        SMS_RATE_PER_MINUTE=str(args.sms_rate),
+        SMS_BURST=str(args.sms_burst),
+    )
+    sys.path.insert(0, os.path.join(ROOT, "raspismsweb"))
+
+    audit = AuditCounter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import raspischeduler
+        # Ticks are driven by hand, not by the background scheduler. The one-shot app
+        # warm-up job must leave the job store first, APScheduler raises
+        # JobLookupError if it is shut down while removing it.
+        while len(raspischeduler.scheduler.get_jobs()) > 1:
+            time.sleep(0.01)
+        raspischeduler.scheduler.shutdown(wait=True)
+        raspischeduler.sms_client.url = sms.api_url
+
+        app = raspischeduler.get_app()
+        with app.app_context():
+            from app import db
+            from app.models import User
+            db.session.add_all(User(email=email, phone_number=f"+3360000{i:04d}") for i, email in enumerate(users))
+            db.session.commit()
+
+    durations = []
+    with audit, contextlib.redirect_stdout(io.StringIO()):
+        for tick in range(args.ticks):
+            if tick:
+                feed.next_generation()
+            started = time.perf_counter()
+            raspischeduler.fetch_and_store_events()
+            durations.append(time.perf_counter() - started)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        raspischeduler.fetch_and_store_events()
+        idle = time.perf_counter() - started
+
+    result = report(
+        "scheduler_tick",
+        {"events": args.events, "users": args.users, "phones": args.phones,
+         "sms_latency_s": args.sms_latency, "sms_failure_rate": args.sms_failure_rate},
+        durations,
+        args.events * args.ticks,
+        audit,
+    )
+    print(json.dumps({"bench": "scheduler_idle_tick", "events": args.events,
+                      "idle_ms": round(idle * 1000, 2), "sms_calls": sms.calls,
+                      "sms_numbers": sms.numbers, "peak_rss_mb": result["peak_rss_mb"]}))
+    feed.stop()
+    sms.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--phones", type=int, default=1)
+    parser.add_argument("--sms-latency", type=float, default=0.0)
+    parser.add_argument("--sms-failure-rate", type=float, default=0.0)
+    parser.add_argument("--sms-rate", type=float, default=10, help="per phone SMS/minute, 0 for no pacing")
+    parser.add_argument("--sms-burst", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    from harness import run_sizes
+    run_sizes(__file__, args, "events", run_size)
+
+
+if __name__ == "__main__":
+    main()
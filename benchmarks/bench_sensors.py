@@ -0,0 +1,112 @@
+"""Load test the sensor pipeline with virtual sensors against a local MQTT broker.
+
+    python benchmarks/bench_sensors.py --sensors 10 100 500 --interval 0.1 \
+        --duration 20 --runtime-error-rate 0.05 --os-error-rate 0.001
+
+Every virtual sensor is a full Acquisition (synthetic driver, aggregator,
+MQTT sink with its own client) running in one process. Each size runs in
+its own child process and prints one JSON line: readings sampled, MQTT
+publishes received by the broker, sink queue depth, drops and peak RSS.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def run_size(args):
+    sys.path.insert(0, os.path.join(ROOT, "sensorsscripts"))
+    from fakes import FakeMqttBroker
+    from harness import peak_rss_mb
+    from acquisition import Acquisition
+    from aggregation import dht22_aggregator
+    from sensors import SyntheticSensor
+    from sinks import MqttSink
+
+    broker = FakeMqttBroker().start()
+
+    def sensor_opener(i):
+        return lambda: SyntheticSensor(noise=args.noise, runtime_error_rate=args.runtime_error_rate,
+                                       os_error_rate=args.os_error_rate, seed=i)
+
+    acquisitions = []
+    for i in range(args.sensors):
+        topics = {"temperature": f"rooms/{i}/temperature", "humidity": f"rooms/{i}/humidity"}
+        sink = MqttSink(broker.host, broker.port, f"room-{i}", topics, f"rooms/{i}/climate",
+                        maxsize=args.queue_size)
+        aggregator = dht22_aggregator() if args.aggregate else None
+        acquisitions.append(Acquisition(sensor_opener(i), [sink], args.interval, f"room{i}", aggregator))
+
+    sampled = [0]
+    sampled_lock = threading.Lock()
+    for acquisition in acquisitions:
+        read = acquisition.read
+
+        def counting_read(read=read):
+            with sampled_lock:
+                sampled[0] += 1
+            return read()
+        acquisition.read = counting_read
+
+    max_depth = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=a.run, daemon=True) for a in acquisitions]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        deadline = started + args.duration
+        while time.perf_counter() < deadline:
+            depth = max(sink.queue.qsize() for a in acquisitions for sink in a.sinks)
+            max_depth = max(max_depth, depth)
+            time.sleep(0.1)
+        for acquisition in acquisitions:
+            acquisition.stop()
+        for thread in threads:
+            thread.join(args.interval + 10)
+        elapsed = time.perf_counter() - started
+
+    sinks = [sink for a in acquisitions for sink in a.sinks]
+    print(json.dumps({
+        "bench": "sensor_pipeline",
+        "sensors": args.sensors, "interval_s": args.interval, "aggregate": args.aggregate,
+        "duration_s": round(elapsed, 1),
+        "readings": sampled[0],
+        "readings_per_sec": round(sampled[0] / elapsed, 1),
+        "mqtt_connections": broker.connections,
+        "mqtt_messages": broker.messages,
+        "mqtt_messages_per_sec": round(broker.messages / elapsed, 1),
+        "mqtt_bytes": broker.bytes,
+        "max_queue_depth": max_depth,
+        "dropped": sum(sink.dropped for sink in sinks),
+        "threads": threading.active_count(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }))
+    broker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--queue-size", type=int, default=100)
+    parser.add_argument("--noise", type=float, default=0.1)
+    parser.add_argument("--runtime-error-rate", type=float, default=0.05)
+    parser.add_argument("--os-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-aggregate", dest="aggregate", action="store_false")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    from harness import run_sizes
+    run_sizes(__file__, args, "sensors", run_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark the batched Azure uplink through a link outage.
+
+    python benchmarks/bench_telemetry.py --readings 2000 --batch 30 --batch-seconds 0.5 \
+        --outage 0.5 --latency 0.05 --replay-rate 50
+
+Readings are offered as fast as possible to an AzureSink backed by a fake
+device client. The link is down for the first `outage` fraction of the
+readings. Prints one JSON line: IoT Hub messages and bytes compared to one
+message per reading, time to drain the backlog, readings lost or reordered,
+and readings left spooled on disk by the last partial batch at shutdown.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=30)
+    parser.add_argument("--batch-seconds", type=float, default=0.5,
+                        help="max batch age, short so partial batches don't stall the run")
+    parser.add_argument("--outage", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--replay-rate", type=float, default=50)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(ROOT, "sensorsscripts"))
+    from fakes import FakeDeviceClient
+    from harness import peak_rss_mb
+    from acquisition import Reading
+    from sinks import AzureSink
+    from telemetry import decode_batch
+
+    client = FakeDeviceClient(args.latency)
+    client.online = False
+    sink = AzureSink(None, tempfile.mkdtemp(prefix="bench-telemetry-"), client=client,
+                     make_message=lambda payload: payload, batch_readings=args.batch,
+                     batch_seconds=args.batch_seconds, replay_rate=args.replay_rate, maxsize=args.readings)
+    sink.uplink.retry_delay = 0.1
+    sink.uplink.max_retry_delay = 0.2
+    sink.start()
+
+    started = time.time()
+    readings = [Reading("bench", started + i * 10, 20 + (i % 50) / 10, 40 + (i % 30) / 10)
+                for i in range(args.readings)]
+    raw_bytes = sum(len(json.dumps({"temperature": r.temperature, "humidity": r.humidity})) for r in readings)
+    outage_end = int(args.readings * args.outage)
+    for reading in readings[:outage_end]:
+        sink.offer(reading)
+    # Everything offered during the outage has been spooled
+    while sink.queue.qsize() or sink.uplink.batch:
+        time.sleep(0.01)
+    backlog = len(sink.uplink.buffer)
+
+    client.online = True
+    link_up = time.perf_counter()
+    for reading in readings[outage_end:]:
+        sink.offer(reading)
+    while sink.queue.qsize() or len(sink.uplink.buffer) or len(sink.uplink.batch) >= args.batch:
+        time.sleep(0.01)
+    drained = time.perf_counter() - link_up
+    sink.stop()
+
+    received = [row[0] for message in client.messages for row in decode_batch(message)["readings"]]
+    # Batches still on disk are sent after a restart, they are not lost
+    spool = sink.uplink.buffer
+    spooled = []
+    for seq in spool.seqs:
+        with open(spool.path(seq), "rb") as file:
+            spooled.extend(row[0] for row in decode_batch(file.read())["readings"])
+    expected = [round(r.timestamp, 1) for r in readings]
+    print(json.dumps({
+        "bench": "azure_uplink",
+        "readings": args.readings, "batch": args.batch, "batch_seconds": args.batch_seconds,
+        "outage": args.outage,
+        "latency_s": args.latency, "replay_rate": args.replay_rate,
+        "messages": len(client.messages),
+        "message_reduction": round(args.readings / max(1, len(client.messages)), 1),
+        "bytes": sum(len(m) for m in client.messages),
+        "per_reading_bytes": raw_bytes,
+        "backlog_batches": backlog,
+        "drain_s": round(drained, 2),
+        "spooled": len(spooled),
+        "lost": len(set(expected) - set(received) - set(spooled)),
+        "in_order": received == sorted(received),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark range and downsampled queries of the sensor time-series store.
+
+    python benchmarks/bench_timeseries.py --days 30 --interval 10 --queries 50
+
+Fills a fresh store with `days` of synthetic readings every `interval`
+seconds, then times a raw one hour range query and 1-minute / 1-hour
+summaries over the last day and week. One JSON line per kind of query.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    sys.path.insert(0, HERE)
+    sys.path.insert(0, os.path.join(ROOT, "sensorsscripts"))
+    from harness import AuditCounter, report
+    from sensors import SyntheticSensor
+    from timeseries import TimeSeriesStore
+
+    store = TimeSeriesStore(tempfile.mkdtemp(prefix="bench-timeseries-"), retention_days=args.days + 1)
+    sensor = SyntheticSensor(seed=1)
+    end = time.time()
+    start = end - args.days * 86400
+    count = int((end - start) / args.interval)
+    written = time.perf_counter()
+    for i in range(count):
+        temperature, humidity = sensor.read()
+        store.append("dht22", start + i * args.interval, temperature, humidity)
+    written = time.perf_counter() - written
+    print(f"# {count} readings appended in {written:.1f}s ({count / written:.0f}/s)", file=sys.stderr)
+
+    cases = [
+        ("range_1h", lambda: store.range("dht22", end - 3600, end), 3600),
+        ("summary_1d_1min", lambda: store.downsample("dht22", end - 86400, end, 60), 86400),
+        ("summary_7d_1min", lambda: store.downsample("dht22", end - 7 * 86400, end, 60), 7 * 86400),
+        ("summary_7d_1h", lambda: store.downsample("dht22", end - 7 * 86400, end, 3600), 7 * 86400),
+    ]
+    params = {"days": args.days, "interval_s": args.interval, "stored_readings": count}
+    for name, query, span in cases:
+        audit = AuditCounter()
+        durations = []
+        with audit:
+            for _ in range(args.queries):
+                started = time.perf_counter()
+                query()
+                durations.append(time.perf_counter() - started)
+        readings = int(span / args.interval) * args.queries
+        report(f"timeseries_{name}", params, durations, readings, audit)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
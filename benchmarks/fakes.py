@@ -0,0 +1,400 @@
+"""Local stand-ins for the services the gateway talks to, for benchmarks.
+
+Every fake is a threading server (HTTP, or raw TCP for MQTT) running in a
+daemon thread on 127.0.0.1 with a random port, so no network access is
+needed.
+"""
+import email
+import json
+import random
+import socketserver
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, unquote
+
+
+class FakeServer:
+    """Run a request handler class on a random local port."""
+
+    server_class = ThreadingHTTPServer
+
+    def __init__(self, handler):
+        self.httpd = self.server_class(("127.0.0.1", 0), handler)
+        self.httpd.fake = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+
+# --- GCURL events feed ---
+
+class EventsFeedHandler(QuietHandler):
+    def do_GET(self):
+        feed = self.server.fake
+        etag = f'"{feed.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_json(
+            {"cursor": feed.version, "full": True, "events": feed.events, "deleted": []},
+            headers={"ETag": etag},
+        )
+
+
+class FakeEventsFeed(FakeServer):
+    """Events feed with `count` events spread over `users` emails.
+
+    Events start in 30 minutes, so their one hour reminder is due at once.
+    next_generation() swaps in a fresh set of events and bumps the ETag.
+    """
+
+    def __init__(self, count, users):
+        super().__init__(EventsFeedHandler)
+        self.count = count
+        self.users = users
+        self.version = 0
+        self.events = []
+        self.next_generation()
+
+    def next_generation(self):
+        self.version += 1
+        start = datetime.now(timezone.utc) + timedelta(minutes=30)
+        self.events = [
+            {
+                "id": f"g{self.version}-{i}",
+                "user_email": self.users[i % len(self.users)],
+                "title": f"Examen {i % 50}",
+                "location": "Amphi A",
+                "start": start.isoformat(),
+                "end": (start + timedelta(hours=2)).isoformat(),
+            }
+            for i in range(self.count)
+        ]
+
+
+# --- RaspiSMS /api/scheduled/ ---
+
+class RaspiSMSHandler(QuietHandler):
+    def do_POST(self):
+        fake = self.server.fake
+        form = parse_qs(self.read_body().decode("utf-8"))
+        if fake.latency:
+            time.sleep(fake.latency)
+        if random.random() < fake.failure_rate:
+            self.send_json({"error": 1, "message": "modem busy"}, status=503)
+            return
+        with fake.lock:
+            fake.calls += 1
+            fake.numbers += len(form.get("numbers[]", []))
+            scheduled_id = fake.calls
+        self.send_json({"error": 0, "response": scheduled_id})
+
+
+class FakeRaspiSMS(FakeServer):
+    """RaspiSMS stand-in with a per-call latency (seconds) and a 503 failure rate."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        super().__init__(RaspiSMSHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.numbers = 0
+
+    @property
+    def api_url(self):
+        return f"{self.url}/api/scheduled/"
+
+
+# --- Google Calendar API v3 ---
+
+class CalendarHandler(QuietHandler):
+    def route(self, method, path):
+        """Answer one Calendar API call, returns (status, body)."""
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        if parts[:2] == ["calendar", "v3"]:
+            parts = parts[2:]
+
+        with fake.lock:
+            fake.calls += 1
+        if parts == ["users", "me", "calendarList"]:
+            return 200, {"items": [
+                {"id": f"cours{i}@fake", "summary": f"Cours {i}"} for i in range(fake.calendars)
+            ]}
+        if len(parts) == 3 and parts[0] == "calendars" and parts[2] == "events":
+            if "syncToken" in query:
+                return 200, {"items": [], "nextSyncToken": "sync-2"}
+            offset = int(query.get("pageToken", ["0"])[0])
+            page = fake.events_page(parts[1], offset)
+            body = {"items": page}
+            if offset + len(page) < fake.events_per_calendar:
+                body["nextPageToken"] = str(offset + len(page))
+            else:
+                body["nextSyncToken"] = "sync-1"
+            return 200, body
+        return 404, {"error": {"code": 404, "message": f"Unknown path {url.path}"}}
+
+    def do_GET(self):
+        status, body = self.route("GET", self.path)
+        self.send_json(body, status=status)
+
+    def do_POST(self):
+        # Batch endpoint: multipart/mixed of application/http requests
+        raw = self.read_body()
+        message = email.message_from_bytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + raw
+        )
+        boundary = "batch_fake_boundary"
+        chunks = []
+        for part in message.get_payload():
+            request_line = part.get_payload().lstrip().splitlines()[0]
+            method, path, _ = request_line.split(" ", 2)
+            status, body = self.route(method, path)
+            content_id = part["Content-ID"].strip("<>")
+            chunks.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n"
+                f"{json.dumps(body)}\r\n"
+            )
+        payload = ("".join(chunks) + f"--{boundary}--\r\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeCalendarAPI(FakeServer):
+    """Calendar API stand-in: `calendars` calendars with `events_per_calendar` events each."""
+
+    PAGE_SIZE = 250
+
+    def __init__(self, calendars=3, events_per_calendar=20, latency=0.0):
+        super().__init__(CalendarHandler)
+        self.calendars = calendars
+        self.events_per_calendar = events_per_calendar
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    @property
+    def api_endpoint(self):
+        return f"{self.url}/calendar/v3/"
+
+    def events_page(self, calendar_id, offset):
+        start = datetime.now(timezone.utc) + timedelta(days=1)
+        titles = ["Examen final", "Cours magistral", "Contrôle continu", "TP libre"]
+        return [
+            {
+                "id": f"{calendar_id.split('@')[0]}-{i}",
+                "status": "confirmed",
+                "summary": titles[i % len(titles)],
+                "start": {"dateTime": (start + timedelta(hours=i)).isoformat()},
+                "end": {"dateTime": (start + timedelta(hours=i, minutes=90)).isoformat()},
+            }
+            for i in range(offset, min(offset + self.PAGE_SIZE, self.events_per_calendar))
+        ]
+
+
+# --- Azure IoT Hub device client ---
+
+class FakeDeviceClient:
+    """In-process stand-in for IoTHubDeviceClient.
+
+    send_message() sleeps `latency` seconds and raises ConnectionError while
+    `online` is False, like the real client once its retries gave up.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.online = True
+        self.lock = threading.Lock()
+        self.messages = []
+
+    def send_message(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.online:
+            raise ConnectionError("IoT Hub unreachable")
+        with self.lock:
+            self.messages.append(message)
+
+    def shutdown(self):
+        pass
+
+
+# --- MQTT 3.1.1 broker ---
+
+class MqttServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MqttHandler(socketserver.BaseRequestHandler):
+    """Just enough MQTT 3.1.1 for paho: CONNECT, PUBLISH (QoS 0/1),
+    SUBSCRIBE, PINGREQ and DISCONNECT. Subscribers get QoS 0 copies."""
+
+    def recv_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed the connection")
+            data += chunk
+        return data
+
+    def read_packet(self):
+        header = self.recv_exact(1)[0]
+        length, shift = 0, 0
+        while True:
+            byte = self.recv_exact(1)[0]
+            length += (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header, self.recv_exact(length)
+
+    def send_packet(self, header, body):
+        length = len(body)
+        encoded = bytearray()
+        while True:
+            byte, length = length % 128, length // 128
+            encoded.append(byte | (0x80 if length else 0))
+            if not length:
+                break
+        with self.lock:
+            self.request.sendall(bytes([header]) + bytes(encoded) + body)
+
+    def handle(self):
+        broker = self.server.fake
+        self.lock = threading.Lock()
+        try:
+            while True:
+                header, body = self.read_packet()
+                kind = header >> 4
+                if kind == 1:  # CONNECT
+                    self.send_packet(0x20, b"\x00\x00")
+                    with broker.lock:
+                        broker.connections += 1
+                elif kind == 3:  # PUBLISH
+                    qos = (header >> 1) & 3
+                    topic_length = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + topic_length].decode("utf-8")
+                    offset = 2 + topic_length
+                    if qos:
+                        self.send_packet(0x40, body[offset:offset + 2])  # PUBACK
+                        offset += 2
+                    broker.received(topic, body[offset:])
+                elif kind == 8:  # SUBSCRIBE
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        length = struct.unpack("!H", body[offset:offset + 2])[0]
+                        broker.subscribe(body[offset + 2:offset + 2 + length].decode("utf-8"), self)
+                        offset += 3 + length
+                        granted.append(0)
+                    self.send_packet(0x90, packet_id + bytes(granted))
+                elif kind == 12:  # PINGREQ
+                    self.send_packet(0xD0, b"")
+                elif kind == 14:  # DISCONNECT
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            broker.unsubscribe(self)
+
+
+def topic_matches(pattern, topic):
+    pattern_parts, topic_parts = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or part not in ("+", topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class FakeMqttBroker(FakeServer):
+    """Local MQTT broker counting publishes, with last payload per topic."""
+
+    server_class = MqttServer
+
+    def __init__(self):
+        super().__init__(MqttHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.bytes = 0
+        self.last = {}
+        self.subscriptions = []
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def received(self, topic, payload):
+        with self.lock:
+            self.messages += 1
+            self.bytes += len(payload)
+            self.last[topic] = payload
+            subscribers = [handler for pattern, handler in self.subscriptions if topic_matches(pattern, topic)]
+        encoded = topic.encode("utf-8")
+        for handler in subscribers:
+            try:
+                handler.send_packet(0x30, struct.pack("!H", len(encoded)) + encoded + payload)
+            except OSError:
+                pass
+
+    def subscribe(self, pattern, handler):
+        with self.lock:
+            self.subscriptions.append((pattern, handler))
+
+    def unsubscribe(self, handler):
+        with self.lock:
+            self.subscriptions = [(p, h) for p, h in self.subscriptions if h is not handler]
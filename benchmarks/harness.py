@@ -0,0 +1,98 @@
+"""Measurement helpers shared by the benchmark scripts."""
+import json
+import os
+import resource
+import subprocess
+import sys
+from collections import Counter
+
+
+# Audit events counted as spawned processes / as syscalls of interest
+PROCESS_EVENTS = {"subprocess.Popen", "os.system", "os.fork", "os.forkpty", "os.posix_spawn", "os.exec"}
+SYSCALL_EVENTS = {"open", "socket.connect", "socket.bind", "os.remove", "os.rename"}
+
+
+class AuditCounter:
+    """Count process spawns and file/socket syscalls through sys.addaudithook.
+
+    Audit hooks can't be removed, so counting is switched on and off instead.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.enabled = False
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if self.enabled and (event in PROCESS_EVENTS or event in SYSCALL_EVENTS):
+            self.counts[event] += 1
+
+    def __enter__(self):
+        self.counts.clear()
+        self.enabled = True
+        return self
+
+    def __exit__(self, *exc):
+        self.enabled = False
+
+    @property
+    def processes(self):
+        return sum(n for event, n in self.counts.items() if event in PROCESS_EVENTS)
+
+    @property
+    def syscalls(self):
+        return sum(n for event, n in self.counts.items() if event in SYSCALL_EVENTS)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non empty list."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(name, params, durations, items, audit):
+    """Print one JSON line with throughput, latency, syscalls and memory."""
+    total = sum(durations)
+    result = {
+        "bench": name,
+        **params,
+        "runs": len(durations),
+        "items_per_sec": round(items / total, 1) if total else None,
+        "p50_ms": round(percentile(durations, 50) * 1000, 2),
+        "p99_ms": round(percentile(durations, 99) * 1000, 2),
+        "processes_spawned": audit.processes,
+        "audited_syscalls": dict(audit.counts),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    print(json.dumps(result))
+    return result
+
+
+def run_sizes(script, args, option, run_size):
+    """Call run_size(args) once per value of the option's list, each in a child process.
+
+    The child gets a single value, so peak RSS and syscall counts belong to
+    that size only. args must come from a parser with a --child flag.
+    """
+    flag = "--" + option.replace("_", "-")
+    if args.child:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+        setattr(args, option, getattr(args, option)[0])
+        run_size(args)
+        return
+
+    for size in getattr(args, option):
+        argv = list(sys.argv[1:])
+        if flag in argv:
+            start = end = argv.index(flag)
+            end += 1
+            while end < len(argv) and not argv[end].startswith("--"):
+                end += 1
+            del argv[start:end]
+        subprocess.run([sys.executable, script, "--child", flag, str(size), *argv], check=True)
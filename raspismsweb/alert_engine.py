@@ -0,0 +1,361 @@
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from metrics import REGISTRY
+
+
+readings_seen = REGISTRY.counter("alert_readings_total", "Sensor readings evaluated by the alert rules")
+alerts_fired = REGISTRY.counter("alerts_fired_total", "Alerts raised, per rule")
+alerts_sent = REGISTRY.counter("alerts_sent_total", "Alert SMS confirmed by RaspiSMS")
+alerts_capped = REGISTRY.counter("alerts_capped_total", "Alert SMS skipped by the hourly per user cap")
+alert_seconds = REGISTRY.histogram("alert_evaluation_seconds", "Time to evaluate the rules of one reading")
+
+
+def topic_matches(pattern, topic):
+    """MQTT topic filter matching, with + and # wildcards."""
+    pattern_parts, topic_parts = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or part not in ("+", topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class RuleState:
+    """Everything a rule remembers about one topic, a few numbers whatever the stream length."""
+
+    __slots__ = ("active", "streak", "since", "last_value", "last_time", "rate")
+
+    def __init__(self):
+        self.active = False
+        self.streak = 0
+        self.since = None
+        self.last_value = None
+        self.last_time = None
+        self.rate = 0.0
+
+
+class Rule:
+    """Alert rule on a topic filter, evaluated one reading at a time.
+
+    check() says if a reading is a breach (True), back to normal (False)
+    or in the hysteresis band (None, nothing changes). The alert fires once
+    after debounce breaching readings in a row, and can only fire again
+    once the value went back to normal.
+    """
+
+    def __init__(self, name, topic, users, field=None, message=None, debounce=1):
+        self.name = name
+        self.topic = topic
+        self.users = users
+        # Key to read in JSON payloads, plain number payloads are used as is
+        self.field = field
+        self.message = message or "Alert {name}: {topic} is {value:.1f}"
+        self.debounce = debounce
+
+    def check(self, state, value, timestamp):
+        raise NotImplementedError
+
+    def update(self, state, value, timestamp):
+        """True when this reading raises the alert."""
+        breach = self.check(state, value, timestamp)
+        if breach is True:
+            state.streak += 1
+            if not state.active and state.streak >= self.debounce:
+                state.active = True
+                return True
+        elif breach is False:
+            state.streak = 0
+            state.active = False
+        return False
+
+    def format(self, topic, value):
+        return self.message.format(name=self.name, topic=topic, value=value)
+
+
+class ThresholdRule(Rule):
+    """Value above `above` (or below `below`), normal again past `clear`."""
+
+    def __init__(self, name, topic, users, above=None, below=None, clear=None, **kwargs):
+        super().__init__(name, topic, users, **kwargs)
+        if (above is None) == (below is None):
+            raise ValueError(f"Rule {name}: set exactly one of above/below")
+        self.above = above
+        self.below = below
+        self.clear = clear if clear is not None else (above if above is not None else below)
+
+    def breached(self, value):
+        return value > self.above if self.above is not None else value < self.below
+
+    def cleared(self, value):
+        return value <= self.clear if self.above is not None else value >= self.clear
+
+    def check(self, state, value, timestamp):
+        if self.breached(value):
+            return True
+        if self.cleared(value):
+            return False
+        return None
+
+
+class SustainedRule(ThresholdRule):
+    """Threshold breached for at least `minutes`, dips into the hysteresis band don't reset the timer."""
+
+    def __init__(self, name, topic, users, minutes, **kwargs):
+        super().__init__(name, topic, users, **kwargs)
+        self.duration = minutes * 60
+
+    def check(self, state, value, timestamp):
+        if self.breached(value):
+            if state.since is None:
+                state.since = timestamp
+            return True if timestamp - state.since >= self.duration else None
+        if self.cleared(value):
+            state.since = None
+            return False
+        return None
+
+
+class RateRule(Rule):
+    """Smoothed rate of change beyond `rise_per_minute` (or `fall_per_minute`).
+
+    The rate is an exponential moving average with a `smoothing_minutes`
+    time constant, so sensor noise doesn't trip it; it is back to normal
+    under half the limit.
+    """
+
+    def __init__(self, name, topic, users, rise_per_minute=None, fall_per_minute=None,
+                 smoothing_minutes=5, **kwargs):
+        super().__init__(name, topic, users, **kwargs)
+        if (rise_per_minute is None) == (fall_per_minute is None):
+            raise ValueError(f"Rule {name}: set exactly one of rise_per_minute/fall_per_minute")
+        # Falls are handled as rises of the negated rate
+        self.sign = 1 if rise_per_minute is not None else -1
+        self.limit = rise_per_minute if rise_per_minute is not None else fall_per_minute
+        self.tau = smoothing_minutes * 60
+
+    def check(self, state, value, timestamp):
+        previous_value, previous_time = state.last_value, state.last_time
+        state.last_value, state.last_time = value, timestamp
+        if previous_time is None or timestamp <= previous_time:
+            return None
+
+        elapsed = timestamp - previous_time
+        instant = (value - previous_value) / elapsed * 60
+        state.rate += (1 - math.exp(-elapsed / self.tau)) * (instant - state.rate)
+        rate = self.sign * state.rate
+        if rate > self.limit:
+            return True
+        if rate < self.limit / 2:
+            return False
+        return None
+
+
+RULE_TYPES = {"threshold": ThresholdRule, "sustained": SustainedRule, "rate": RateRule}
+
+
+def load_rules(path):
+    """Rules from {"rules": [{"type": "threshold", "name": ..., "topic": ..., "users": [...], ...}]}.
+
+    Names must be unique: the engine keeps each rule's state under its name.
+    """
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r") as file:
+        config = json.load(file)
+    rules = []
+    for options in config.get("rules", []):
+        options = dict(options)
+        rule_type = options.pop("type")
+        if rule_type not in RULE_TYPES:
+            raise ValueError(f"Unknown alert rule type {rule_type!r}")
+        rule = RULE_TYPES[rule_type](**options)
+        if any(other.name == rule.name for other in rules):
+            raise ValueError(f"Duplicate alert rule name {rule.name!r}")
+        rules.append(rule)
+    return rules
+
+
+class AlertEngine:
+    """Evaluate the rules incrementally on each reading.
+
+    Each (rule, topic) pair keeps one RuleState, so a reading costs a
+    dict lookup and a few comparisons per matching rule, never a scan of
+    past readings. Raised alerts are handed to `notify(rule, topic, value)`.
+    """
+
+    def __init__(self, rules, notify):
+        self.rules = rules
+        self.notify = notify
+        self.states = {}
+        # topic -> rules whose filter matches it, filled on first sight of a topic
+        self.routes = {}
+
+    def subscriptions(self):
+        return sorted({rule.topic for rule in self.rules})
+
+    def rules_for(self, topic):
+        rules = self.routes.get(topic)
+        if rules is None:
+            rules = self.routes[topic] = [rule for rule in self.rules if topic_matches(rule.topic, topic)]
+        return rules
+
+    @staticmethod
+    def parse(payload, field):
+        if field is None:
+            return float(payload), None
+        data = json.loads(payload)
+        return float(data[field]), data.get("timestamp")
+
+    def on_reading(self, topic, payload, received=None):
+        received = received or time.time()
+        started = time.perf_counter()
+        parsed = {}
+        for rule in self.rules_for(topic):
+            if rule.field not in parsed:
+                try:
+                    parsed[rule.field] = self.parse(payload, rule.field)
+                except (ValueError, KeyError, TypeError):
+                    parsed[rule.field] = None
+            if parsed[rule.field] is None:
+                continue
+            value, timestamp = parsed[rule.field]
+            state = self.states.get((rule.name, topic))
+            if state is None:
+                state = self.states[(rule.name, topic)] = RuleState()
+            if rule.update(state, value, received if timestamp is None else timestamp):
+                alerts_fired.inc(rule=rule.name)
+                self.notify(rule, topic, value)
+        readings_seen.inc()
+        alert_seconds.observe(time.perf_counter() - started)
+
+
+class HourlyCap:
+    """At most `limit` alerts per user over any sliding hour, none when limit is 0."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.sent = {}
+
+    def allow(self, email, now):
+        if self.limit <= 0:
+            return False
+        times = self.sent.get(email)
+        if times is None:
+            times = self.sent[email] = deque(maxlen=self.limit)
+        if len(times) == self.limit and now - times[0] < 3600:
+            return False
+        times.append(now)
+        return True
+
+
+class AlertSender:
+    """Send raised alerts as SMS from a worker thread.
+
+    The MQTT network thread only queues alerts. The worker resolves the
+    users' phone numbers through the user cache (inside an app context),
+    applies the hourly cap and sends everything queued together through
+    the dispatch queue.
+    """
+
+    def __init__(self, dispatch_queue, user_cache, get_app, db, max_per_hour=4):
+        self.dispatch_queue = dispatch_queue
+        self.user_cache = user_cache
+        self.get_app = get_app
+        self.db = db
+        self.cap = HourlyCap(max_per_hour)
+        self.alerts = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="alert-sender", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def notify(self, rule, topic, value):
+        print(f"[ALERT] {rule.name} on {topic}: {value}")
+        self.alerts.put((rule, rule.format(topic, value)))
+
+    def run(self):
+        while True:
+            batch = [self.alerts.get()]
+            while True:
+                try:
+                    batch.append(self.alerts.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.send(batch)
+            except Exception as e:
+                print(f"[ERROR] Failed to send {len(batch)} alert(s): {e}")
+
+    def send(self, batch):
+        now = time.time()
+        at = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        with self.get_app().app_context():
+            try:
+                users = self.user_cache.resolve(email for rule, _ in batch for email in rule.users)
+            finally:
+                self.db.session.remove()
+
+        messages = []
+        for rule, sms_text in batch:
+            for email in rule.users:
+                user = users.get(email)
+                if not user or not user.phone_number:
+                    print(f"[WARNING] No phone number for {email}, alert {rule.name} not sent")
+                    continue
+                if not self.cap.allow(email, now):
+                    alerts_capped.inc()
+                    print(f"[INFO] Hourly alert cap reached for {email}, alert {rule.name} skipped")
+                    continue
+                messages.append((sms_text, user.phone_number, at))
+
+        for sms_text, at, numbers, payload, error in self.dispatch_queue.dispatch(messages):
+            if error:
+                print(f"[ERROR] Alert SMS failed for {len(numbers)} number(s): {error}")
+                continue
+            alerts_sent.inc(len(numbers))
+            print(f"[SUCCESS] Alert sent to {len(numbers)} number(s): {sms_text}")
+
+
+class MqttAlertListener:
+    """Feed the readings of the rules' topics from the broker to the engine."""
+
+    def __init__(self, engine, broker, port, client_id="raspisms_alerts"):
+        import paho.mqtt.client as mqtt
+        self.engine = engine
+        self.broker = broker
+        self.port = port
+        self.client = mqtt.Client(client_id=client_id, callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"Connection to MQTT broker failed with code {rc}")
+            return
+        # Subscribed again on every reconnect
+        for topic in self.engine.subscriptions():
+            client.subscribe(topic)
+        print(f"Alert engine listening on {', '.join(self.engine.subscriptions())}")
+
+    def on_message(self, client, userdata, message):
+        try:
+            self.engine.on_reading(message.topic, message.payload.decode("utf-8"))
+        except Exception as e:
+            print(f"[ERROR] Alert rules failed on {message.topic}: {e}")
+
+    def start(self):
+        self.client.connect_async(self.broker, self.port, 60)
+        self.client.loop_start()
+        return self
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
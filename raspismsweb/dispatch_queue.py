@@ -0,0 +1,201 @@
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from raspisms_client import RaspiSMSError, MAX_NUMBERS_PER_CALL
+from metrics import REGISTRY
+
+
+api_seconds = REGISTRY.histogram("sms_api_duration_seconds", "RaspiSMS API call latency per phone")
+api_errors = REGISTRY.counter("sms_api_errors_total", "Failed RaspiSMS API calls per phone")
+dead_letters = REGISTRY.counter("sms_dead_letters_total", "SMS batches written to the dead-letter file")
+sms_deferred = REGISTRY.counter("sms_deferred_total", "SMS whose send time was pushed back by a phone rate limit")
+
+# Format of the RaspiSMS "at" field
+AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens/second, one token per SMS.
+
+    Tokens are reserved ahead of time on an epoch clock: reserve() never
+    waits, it returns when the bucket will hold the tokens, i.e. when the
+    SMS may go out. count must not exceed the capacity.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.time()
+
+    def reserve(self, count, not_before):
+        if not_before > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (not_before - self.updated) * self.rate)
+            self.updated = not_before
+        if self.tokens < count:
+            # Earlier chunks are still going out, wait for the missing tokens
+            self.updated += (count - self.tokens) / self.rate
+            self.tokens = count
+        self.tokens -= count
+        return self.updated
+
+
+class Modem:
+    """One RaspiSMS phone (GSM dongle) with its own rate limit, none if rate_per_minute is 0."""
+
+    def __init__(self, id_phone, rate_per_minute, burst):
+        self.id_phone = id_phone
+        self.bucket = TokenBucket(rate_per_minute / 60, burst) if rate_per_minute > 0 else None
+        self.sent = 0
+        self.failed = 0
+
+    def send_time(self, at, count):
+        """RaspiSMS "at" for count SMS on this phone, pushed back to keep it under its rate."""
+        if self.bucket is None:
+            return at
+        wanted = max(datetime.strptime(at, AT_FORMAT).timestamp(), time.time())
+        start = self.bucket.reserve(count, wanted)
+        if start <= wanted:
+            return at
+        sms_deferred.inc(count, phone=self.id_phone)
+        return datetime.fromtimestamp(math.ceil(start)).strftime(AT_FORMAT)
+
+
+class DispatchQueue:
+    """Asyncio outbound queue spreading SMS batches over several modems.
+
+    Every modem runs its own workers pulling from one shared queue, so the
+    least busy modem picks up the next batch. RaspiSMS sends each batch at
+    its "at" time, so the rate limit never delays the API call: batches
+    are at most burst numbers long, and a batch that would exceed its
+    modem's token bucket gets a later "at" instead. The send time is
+    reserved once per batch, on the first modem that picks it up.
+    Transient failures are retried with exponential backoff and jitter
+    (possibly on another modem). Other errors, and batches that keep
+    failing, are appended to a dead-letter JSON lines file. A batch only
+    counts as sent once RaspiSMS confirmed it.
+    """
+
+    def __init__(self, client, phone_ids, dead_letter_path, rate_per_minute=10, burst=10,
+                 workers_per_modem=2, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        self.client = client
+        self.modems = [Modem(id_phone, rate_per_minute, burst) for id_phone in phone_ids]
+        self.dead_letter_path = dead_letter_path
+        self.workers_per_modem = workers_per_modem
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # With a rate limit every call is one bucketful, with its own send time
+        self.chunk_size = min(MAX_NUMBERS_PER_CALL, max(1, burst)) if rate_per_minute > 0 else MAX_NUMBERS_PER_CALL
+        # The scheduler tick and the alert sender share the modems and their buckets
+        self.lock = threading.Lock()
+
+    def backoff(self, attempt):
+        """Full jitter exponential backoff."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def dead_letter(self, job, error):
+        record = {
+            "text": job["text"],
+            "numbers": job["numbers"],
+            "at": job["at"],
+            "attempts": job["attempts"],
+            "error": str(error),
+            "failed_at": time.time(),
+        }
+        try:
+            with open(self.dead_letter_path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+        except (OSError, TypeError, ValueError) as e:
+            # Still reported as failed to the caller, only the record is lost
+            print(f"[ERROR] Could not write the dead-letter file: {e}")
+        dead_letters.inc()
+        print(f"[ERROR] Dead-lettered SMS for {len(job['numbers'])} number(s) after {job['attempts']} attempt(s): {error}")
+
+    async def _worker(self, modem, queue, results, retries):
+        while True:
+            job = await queue.get()
+            retrying = False
+            try:
+                job["attempts"] += 1
+                started = time.perf_counter()
+                try:
+                    # Retries keep the first send time, failed attempts don't use up tokens
+                    if job["send_at"] is None:
+                        job["send_at"] = modem.send_time(job["at"], len(job["numbers"]))
+                    at = job["send_at"]
+                    payload = await asyncio.to_thread(
+                        self.client.schedule, job["text"], job["numbers"], modem.id_phone, at
+                    )
+                except Exception as e:
+                    # Anything but a RaspiSMS error is a bug or bad data, retrying won't help
+                    transient = isinstance(e, RaspiSMSError) and e.transient
+                    api_errors.inc(phone=modem.id_phone, transient=transient)
+                    modem.failed += 1
+                    if transient and job["attempts"] < self.max_attempts:
+                        print(f"[WARNING] Phone {modem.id_phone} failed ({e}), retry {job['attempts']}")
+                        retries.add(asyncio.create_task(self._retry(queue, job)))
+                        retrying = True
+                    else:
+                        self.dead_letter(job, e)
+                        results.append((job["text"], job["at"], job["numbers"], None, e))
+                    continue
+                finally:
+                    api_seconds.observe(time.perf_counter() - started, phone=modem.id_phone)
+
+                if at != job["at"]:
+                    print(f"[INFO] Phone {modem.id_phone} busy, {len(job['numbers'])} SMS pushed back to {at}")
+                modem.sent += len(job["numbers"])
+                results.append((job["text"], job["at"], job["numbers"], payload, None))
+            finally:
+                # A retried job is only done once it is back in the queue
+                if not retrying:
+                    queue.task_done()
+
+    async def _retry(self, queue, job):
+        await asyncio.sleep(self.backoff(job["attempts"]))
+        await queue.put(job)
+        queue.task_done()
+
+    async def dispatch_async(self, messages):
+        groups = {}
+        for text, number, at in messages:
+            groups.setdefault((text, at), []).append(number)
+
+        queue = asyncio.Queue()
+        for (text, at), numbers in groups.items():
+            for i in range(0, len(numbers), self.chunk_size):
+                queue.put_nowait({"text": text, "at": at, "numbers": numbers[i:i + self.chunk_size],
+                                 "attempts": 0, "send_at": None})
+
+        results = []
+        retries = set()
+        workers = [
+            asyncio.create_task(self._worker(modem, queue, results, retries))
+            for modem in self.modems
+            for _ in range(self.workers_per_modem)
+        ]
+
+        await queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, *retries, return_exceptions=True)
+        return results
+
+    def dispatch(self, messages):
+        """Send (text, number, at) messages grouped by text and time.
+
+        Returns one (text, at, numbers, payload, error) tuple per API call, at
+        being the requested time, so the caller knows which numbers went out.
+
+        Calls from several threads run one after the other.
+        """
+        with self.lock:
+            return asyncio.run(self.dispatch_async(messages))
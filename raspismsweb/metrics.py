@@ -0,0 +1,207 @@
+"""Small in-process metrics: counters, histograms and per-tick trace spans.
+
+Metrics can be read as Prometheus text (serve_http) or dumped as a JSON
+snapshot (dump_json). A trace groups the spans of one tick so a slow tick
+can be broken down by phase.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return {"type": "counter", "help": self.help,
+                    "values": [{"labels": dict(key), "value": value} for key, value in self.values.items()]}
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {"type": "histogram", "help": self.help, "buckets": list(self.buckets),
+                    "values": [{"labels": dict(key), "counts": list(series["counts"]),
+                                "sum": series["sum"], "count": series["count"]}
+                               for key, series in self.values.items()]}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, *args):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, *args)
+            return self.metrics[name]
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets)
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.items())
+        return {"time": time.time(), "metrics": {name: metric.snapshot() for name, metric in metrics}}
+
+    def dump_json(self, path, traces=None):
+        """Atomically write the snapshot (and optional recent traces) to path."""
+        snapshot = self.snapshot()
+        if traces is not None:
+            snapshot["traces"] = traces
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(snapshot, file)
+        os.replace(tmp_path, path)
+
+
+def _escape_label(value):
+    """Label value escaped as the text format wants: backslash, double quote, newline."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in items) + "}"
+
+
+def render_prometheus(snapshot):
+    """Prometheus text exposition format of a Registry snapshot."""
+    lines = []
+    for name, metric in sorted(snapshot["metrics"].items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for series in metric["values"]:
+            labels = series["labels"]
+            if metric["type"] == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {series['value']}")
+                continue
+            for bound, count in zip(metric["buckets"], series["counts"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, {'le': bound})} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {series['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {series['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {series['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Records the phases (spans) of each tick and keeps the last few traces."""
+
+    def __init__(self, registry, keep=20):
+        self.phase_seconds = registry.histogram("phase_duration_seconds", "Duration of each tick phase")
+        self.traces = deque(maxlen=keep)
+        self.local = threading.local()
+
+    @contextmanager
+    def trace(self, name, budget=None):
+        """Collect spans of one run; print the breakdown when it exceeds budget seconds."""
+        trace = {"name": name, "start": time.time(), "spans": []}
+        started = time.perf_counter()
+        self.local.trace = trace
+        self.local.started = started
+        try:
+            yield trace
+        finally:
+            trace["duration"] = time.perf_counter() - started
+            self.local.trace = None
+            self.traces.append(trace)
+            if budget is not None and trace["duration"] > budget:
+                phases = ", ".join(f"{s['name']}={s['duration']:.2f}s" for s in trace["spans"])
+                print(f"[WARNING] {name} took {trace['duration']:.1f}s (budget {budget}s): {phases}")
+
+    @contextmanager
+    def span(self, name):
+        trace = getattr(self.local, "trace", None)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            self.phase_seconds.observe(duration, phase=name)
+            if trace is not None:
+                trace["spans"].append({"name": name, "offset": started - self.local.started, "duration": duration})
+
+
+REGISTRY = Registry()
+tracer = Tracer(REGISTRY)
+
+
+def serve_http(port, registry=REGISTRY, host="127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /traces (JSON) from a daemon thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = render_prometheus(registry.snapshot()).encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            elif self.path == "/traces":
+                body = json.dumps(list(tracer.traces)).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -1,113 +1,274 @@
 import requests  
-import subprocess  
-import json  
 import os  
+import threading
+import time
 from flask import current_app  
 from app import db  
 from app.models import User  
-from datetime import datetime, timedelta  
+from collections import namedtuple
+from datetime import datetime  
 from apscheduler.schedulers.background import BackgroundScheduler  
+from sqlalchemy import text
+from raspisms_client import RaspiSMSClient
+from dispatch_queue import DispatchQueue
+from sent_ledger import SentLedger, event_start
+from reminder_queue import ReminderQueue, load_lead_config
+from user_cache import UserCache
+from metrics import REGISTRY, tracer, serve_http
+from alert_engine import AlertEngine, AlertSender, MqttAlertListener, load_rules
 
 
 EVENTS_URL = os.environ['GCURL']  
+# Reused across ticks so the feed connection stays alive
+feed_session = requests.Session()
+# Last feed cursor/ETag seen, so idle ticks cost a 304 and busy ones a delta
+feed_state = {"cursor": None, "etag": None}
 
 
 RASPI_SMS_API_KEY = os.environ['RASPISMSAPI']
 RASPI_SMS_URL = "http://localhost:8080/api/scheduled/"   
 ID_PHONE = os.environ['IDPHONE']  
+# Comma separated RaspiSMS phone ids, one per GSM dongle
+ID_PHONES = os.environ.get('IDPHONES', ID_PHONE).split(',')
+# Per phone pacing of the RaspiSMS send times ("at"), 0 turns it off
+SMS_RATE_PER_MINUTE = float(os.environ.get('SMS_RATE_PER_MINUTE', 10))
+SMS_BURST = int(os.environ.get('SMS_BURST', 10))
+WORKERS_PER_PHONE = 2
+
+# One pooled keep-alive client for the whole process
+sms_client = RaspiSMSClient(RASPI_SMS_URL, RASPI_SMS_API_KEY, pool_size=len(ID_PHONES) * WORKERS_PER_PHONE)
 
 # --- Logs ---  
 SENT_SMS_FILE = os.environ['LOGPATH']  
+# Compacted at startup and then once a day from the tick, appended to in between
+sent_ledger = SentLedger(SENT_SMS_FILE)
+
+# Rate limited, retrying outbound queue spread over all phones
+DEAD_LETTER_FILE = os.environ.get('DEADLETTERPATH', f"{SENT_SMS_FILE}.deadletter.jsonl")
+dispatch_queue = DispatchQueue(sms_client, ID_PHONES, DEAD_LETTER_FILE, SMS_RATE_PER_MINUTE,
+                               SMS_BURST, WORKERS_PER_PHONE)
+
+# Reminders waiting for their due time (event start - lead time), kept across restarts
+REMINDERS_FILE = os.environ.get('REMINDERPATH', f"{SENT_SMS_FILE}.reminders.json")
+default_leads, user_leads = load_lead_config(os.environ.get('REMINDER_LEADS_FILE'))
+reminder_queue = ReminderQueue(REMINDERS_FILE, default_leads, user_leads)
+
+TICK_MINUTES = 2
+
+# Prometheus text on http://127.0.0.1:<METRICS_PORT>/metrics, JSON snapshot every tick to METRICS_PATH
+METRICS_PORT = os.environ.get('METRICS_PORT')
+METRICS_PATH = os.environ.get('METRICS_PATH')
+feed_responses = REGISTRY.counter("feed_responses_total", "Events feed responses by HTTP status")
+feed_events = REGISTRY.counter("feed_events_total", "Events received from the feed")
+sms_sent = REGISTRY.counter("sms_sent_total", "Reminders confirmed by RaspiSMS")
+sms_failed = REGISTRY.counter("sms_failed_total", "Reminders dead-lettered after all retries")
+tick_errors = REGISTRY.counter("tick_errors_total", "Ticks aborted by an exception")
+tick_seconds = REGISTRY.histogram("tick_duration_seconds", "Duration of a whole scheduler tick")
+
+# One reminder SMS to send, reminder is the (lead, due, event) popped from the queue
+PendingSms = namedtuple("PendingSms", "reminder_id user_email end text phone_number at reminder")
+
+# email -> (id, phone_number), invalidated when a user is edited
+user_cache = UserCache(User)
+user_cache.watch()
+
+# Sensor alerts: rules evaluated on each MQTT reading, SMS sent to the rule's users
+ALERT_RULES_FILE = os.environ.get('ALERT_RULES_FILE')
+MQTT_BROKER = os.environ.get('MQTT_BROKER', "127.0.0.1")
+MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
+# 0 sends no alert SMS at all, alerts are still logged
+ALERTS_PER_USER_HOUR = int(os.environ.get('ALERTS_PER_USER_HOUR', 4))
+
+# Flask app built once and reused by every tick, so the DB engine pool survives
+_app = None
+_app_lock = threading.Lock()
+
+def get_app():
+    """Build the Flask app on first use and warm up its DB connection pool."""
+    global _app
+    with _app_lock:
+        if _app is None:
+            from app import create_app
+            started = time.perf_counter()
+            app = create_app()
+            built = time.perf_counter()
+            with app.app_context():
+                db.session.execute(text("SELECT 1"))
+                db.session.remove()
+            warmed = time.perf_counter()
+            print(f"[INFO] Scheduler app ready: create_app {(built - started) * 1000:.0f} ms, "
+                  f"DB warm-up {(warmed - built) * 1000:.0f} ms")
+            _app = app
+    return _app
+
+def send_pending_sms(pending):
+    """Send queued PendingSms in grouped API calls and record the confirmed ones.
+
+    Returns the PendingSms that were dead-lettered after all retries.
+    """
+    # Several users can share a phone number, keep every reminder per message
+    owners = {}
+    for sms in pending:
+        owners.setdefault((sms.text, sms.at, sms.phone_number), []).append(sms)
+
+    failed = []
+    messages = [(sms_text, number, at) for sms_text, at, number in owners]
+    with tracer.span("sms_dispatch"):
+        results = dispatch_queue.dispatch(messages)
+    for sms_text, at, numbers, payload, error in results:
+        sent = [sms for number in numbers for sms in owners[(sms_text, at, number)]]
+        if error:
+            print(f"[ERROR] SMS API Error for {len(numbers)} number(s): {error}")
+            failed.extend(sent)
+            sms_failed.inc(len(sent))
+            continue
+
+        print(f"[SUCCESS] SMS scheduled at {at} for {len(numbers)} number(s): {sms_text}")
+        print(f"[SMS API RESPONSE]: {payload}")
+        with tracer.span("ledger_write"):
+            sent_ledger.add_many((sms.reminder_id, sms.user_email, sms.end) for sms in sent)
+        sms_sent.inc(len(sent))
+    return failed
 
-def load_sent_sms():  
-    """Load sent SMS records from JSON file."""  
-    if os.path.exists(SENT_SMS_FILE):  
-        with open(SENT_SMS_FILE, "r") as file:  
-            return json.load(file)  
-    return {}   
+def format_event_time(event):
+    """Human readable local start time, or just the day for all-day events."""
+    if event.get("all_day", "T" not in event["start"]):
+        return event["start"]
+    return datetime.fromtimestamp(event_start(event)).strftime("%Y-%m-%d %H:%M:%S")
 
-def save_sent_sms(sent_sms):  
-    """Save updated sent SMS records to JSON file."""  
-    with open(SENT_SMS_FILE, "w") as file:  
-        json.dump(sent_sms, file, indent=4)  
+def send_due_reminders():
+    """Send the reminders falling due before the next tick."""
+    now = time.time()
+    due = reminder_queue.pop_due(now + TICK_MINUTES * 60, now)
+    print(f"[INFO] {len(due)} reminder(s) due, {len(reminder_queue)} still queued")
+    if not due:
+        return
+
+    pending = []
+    with tracer.span("user_lookup"):
+        users = user_cache.resolve(event["user_email"] for _, _, event in due)
+    for lead, due_at, event in due:
+        user = users[event["user_email"]]
+        if not user:
+            # Kept in the queue and looked up again every tick until the event starts
+            print(f"[WARNING] User {event['user_email']} not found. Retrying next tick for event: {event['title']}")
+            reminder_queue.push_back(lead, due_at, event)
+            continue
+
+        # A moved event gets new reminders, the start time is part of the key
+        reminder_id = f"{event['id']}@{event['start']}:{lead}"
+        if (reminder_id, user.email) in sent_ledger:
+            print(f"[INFO] Reminder already sent for event '{event['title']}' to {user.email}. Skipping.")
+            continue
+
+        sms_text = f"Reminder: {event['title']} at {event.get('location', 'Unknown location')} on {format_event_time(event)}"
+        # RaspiSMS delivers the SMS at the exact due time within the tick window
+        at_time = datetime.fromtimestamp(max(due_at, now)).strftime("%Y-%m-%d %H:%M:%S")
+
+        print(f"[INFO] Preparing SMS for {user.email} ({user.phone_number}), {lead} min before")
+        print(f"[SMS CONTENT]: {sms_text}")
+        pending.append(PendingSms(reminder_id, user.email, event.get("end_ts") or event.get("end"), sms_text,
+                                  user.phone_number, at_time, (lead, due_at, event)))
+
+    if not pending:
+        return
+    try:
+        failed = send_pending_sms(pending)
+    except Exception:
+        # Don't lose popped reminders if the dispatch itself blew up
+        for sms in pending:
+            reminder_queue.push_back(*sms.reminder)
+        raise
+    if failed:
+        print(f"[ERROR] {len(failed)} reminder(s) moved to the dead-letter file {DEAD_LETTER_FILE}")
+
+def sync_events_feed():
+    """Pull new, changed and deleted events from the feed into the reminder queue."""
+    headers = {}
+    params = {}
+    if feed_state["etag"]:
+        headers["If-None-Match"] = feed_state["etag"]
+    if feed_state["cursor"] is not None:
+        params["since"] = feed_state["cursor"]
+
+    with tracer.span("feed_fetch"):
+        response = feed_session.get(EVENTS_URL, params=params, headers=headers, timeout=30)  
+    feed_responses.inc(status=response.status_code)
+    if response.status_code == 304:
+        print("[INFO] Events feed unchanged.")
+        return
+    if response.status_code != 200:  
+        print(f"[ERROR] Failed to fetch events. Status Code: {response.status_code}")  
+        return  
+
+    with tracer.span("feed_parse"):
+        data = response.json()  
+    events = data.get("events", [])  
+    deleted = data.get("deleted", [])
+
+    full = data.get("full", True)
+    feed_events.inc(len(events))
+    print(f"Total events fetched ({'full' if full else 'delta'}): {len(events)}, deleted: {len(deleted)}")  
+    with tracer.span("queue_update"):
+        if full:
+            reminder_queue.replace_all(events)
+        else:
+            for event in events:
+                reminder_queue.upsert(event)
+            for event in deleted:
+                reminder_queue.remove(event["id"], event["user_email"])
+
+    # Only move the cursor forward once the events were queued
+    feed_state["cursor"] = data.get("cursor")
+    feed_state["etag"] = response.headers.get("ETag")
 
 def fetch_and_store_events():  
-    """Fetch events from API and send SMS notifications."""  
-    from app import create_app  
-    app = create_app()  
-    with app.app_context():  
+    """Sync the events feed and send the reminders that are due."""  
+    started = time.perf_counter()
+    # Phase breakdown is printed only when the tick overruns its interval
+    with tracer.trace("scheduler_tick", budget=TICK_MINUTES * 60), get_app().app_context():  
         try:  
             print("\n--- Fetching events ---")  
-            response = requests.get(EVENTS_URL)  
-            if response.status_code != 200:  
-                print(f"[ERROR] Failed to fetch events. Status Code: {response.status_code}")  
-                return  
-
-            data = response.json()  
-            events = data.get("events", [])  
-
-            print(f"Total events fetched: {len(events)}")  
-            if not events:  
-                print("[INFO] No new events to process.")  
-                return  
-
-            # Load sent SMS records  
-            sent_sms = load_sent_sms()  
-
-            for event in events:  
-                user = User.query.filter_by(email=event["user_email"]).first()  
-                if not user:  
-                    print(f"[WARNING] User {event['user_email']} not found. Skipping event: {event['title']}")  
-                    continue  
-
-                event_id = event["id"]  
-                user_email = user.email  
-
-                #Check if SMS was already sent for this event-user pair (so we can avoid duplicate)
-                if event_id in sent_sms and user_email in sent_sms[event_id]:  
-                    print(f"[INFO] SMS already sent for event '{event['title']}' to {user_email}. Skipping.")  
-                    continue  
-
-                print(f"\n[INFO] Processing event '{event['title']}' for user: {user_email}")  
-
-                # Format event details  
-                formatted_time = datetime.strptime(event["start"][:19], "%Y-%m-%dT%H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")  
-                sms_text = f"Reminder: {event['title']} at {event.get('location', 'Unknown location')} on {formatted_time}"  
-                phone_number = user.phone_number.replace("+", "%2B")  # Ensure proper formatting  
-                at_time = (datetime.now() + timedelta(minutes=3)).strftime("%Y-%m-%d %H:%M:%S")  
-
-                print(f"[INFO] Preparing SMS for {user_email} ({user.phone_number})")  
-                print(f"[SMS CONTENT]: {sms_text}")  
-
-                # Construct cURL command to send SMS  
-                curl_command = f"""curl -X POST "{RASPI_SMS_URL}" \
--H 'X-Api-Key: {RASPI_SMS_API_KEY}' \
--d 'text={sms_text}' \
--d 'numbers={phone_number}' \
--d 'id_phone={ID_PHONE}' \
--d 'at={at_time}'"""  
-
-                #Execute cURL  (we couldve used requests python lib, but i just felt like it)
-                process = subprocess.run(curl_command, shell=True, capture_output=True, text=True)  
-
-                #logs stuff
-                print(f"[SUCCESS] SMS sent to {user_email} ({user.phone_number})")  
-                print(f"[SMS API RESPONSE]: {process.stdout.strip()}")  
-                if process.stderr.strip():  
-                    print(f"[ERROR] SMS API Error: {process.stderr.strip()}")  
-
-                #Update the "sent" SMS records  
-                if event_id not in sent_sms:  
-                    sent_sms[event_id] = []  
-                sent_sms[event_id].append(user_email)  
-                save_sent_sms(sent_sms)  # Save updated record  
+            sync_events_feed()
+            send_due_reminders()
+            with tracer.span("ledger_compact"):
+                sent_ledger.compact_if_due()
 
         except Exception as e:  
+            tick_errors.inc()
             print(f"[FATAL ERROR] Exception occurred: {e}")  
 
+        finally:
+            with tracer.span("reminder_save"):
+                reminder_queue.save()
+            # Hand the connection back to the pool for the next tick
+            db.session.remove()
+            elapsed = time.perf_counter() - started
+            tick_seconds.observe(elapsed)
+            print(f"[INFO] Tick done in {elapsed * 1000:.0f} ms")
+
+    if METRICS_PATH:
+        try:
+            REGISTRY.dump_json(METRICS_PATH, traces=list(tracer.traces))
+        except OSError as e:
+            print(f"[ERROR] Could not write metrics snapshot: {e}")
+
+alert_rules = load_rules(ALERT_RULES_FILE)
+if alert_rules:
+    alert_sender = AlertSender(dispatch_queue, user_cache, get_app, db, ALERTS_PER_USER_HOUR).start()
+    alert_engine = AlertEngine(alert_rules, alert_sender.notify)
+    alert_listener = MqttAlertListener(alert_engine, MQTT_BROKER, MQTT_PORT).start()
+    print(f"Alert engine started with {len(alert_rules)} rule(s).")
+
+if METRICS_PORT:
+    serve_http(int(METRICS_PORT))
+    print(f"Metrics served on port {METRICS_PORT}.")
+
 #launch the scheduler stuff
 scheduler = BackgroundScheduler()  
-scheduler.add_job(fetch_and_store_events, "interval", minutes=2)  
+scheduler.add_job(fetch_and_store_events, "interval", minutes=TICK_MINUTES)  
+# Build the app right away in the background instead of on the first tick
+scheduler.add_job(get_app)
 
 if scheduler.state != 1:  
     scheduler.start()  
@@ -0,0 +1,67 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# RaspiSMS refuses very long number lists, so big groups are split in chunks
+MAX_NUMBERS_PER_CALL = 200
+
+
+class RaspiSMSError(Exception):
+    """Raised when RaspiSMS rejects a call or answers something we can't read."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def transient(self):
+        """Network errors, throttling and server errors are worth retrying."""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class RaspiSMSClient:
+    """Keep-alive HTTP client for the RaspiSMS /api/scheduled/ endpoint."""
+
+    def __init__(self, url, api_key, pool_size=4, timeout=10):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"X-Api-Key": api_key})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def schedule(self, text, numbers, id_phone, at):
+        """Schedule one SMS text for a list of numbers, return the RaspiSMS response."""
+        data = {
+            "text": text,
+            "numbers[]": list(numbers),
+            "id_phone": id_phone,
+            "at": at,
+        }
+        try:
+            response = self.session.post(self.url, data=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise RaspiSMSError(f"Request to RaspiSMS failed: {e}") from e
+
+        if response.status_code >= 300:
+            raise RaspiSMSError(
+                f"RaspiSMS answered HTTP {response.status_code}: {response.text.strip()}",
+                status_code=response.status_code,
+            )
+
+        try:
+            payload = response.json()
+        except ValueError as e:
+            raise RaspiSMSError(
+                f"RaspiSMS answered a non JSON body: {response.text.strip()}",
+                status_code=response.status_code,
+            ) from e
+
+        # RaspiSMS sets "error" to a non zero code when the message was refused
+        if not isinstance(payload, dict) or payload.get("error"):
+            raise RaspiSMSError(f"RaspiSMS refused the message: {payload}", status_code=response.status_code)
+        return payload
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from sent_ledger import event_start
+
+
+# Default reminders: the day before and one hour before the event
+DEFAULT_LEAD_MINUTES = [24 * 60, 60]
+
+
+class ReminderQueue:
+    """Min-heap of reminders keyed on their due time (event start - lead time).
+
+    Each (event_id, user_email, lead) is one reminder. Rescheduling pushes a
+    fresh heap entry and the stale one is skipped when popped, so upserts are
+    O(log n) and a tick only touches the reminders that are due.
+    The queue is snapshotted to disk so it survives restarts.
+    """
+
+    def __init__(self, snapshot_path, default_leads=None, user_leads=None):
+        self.snapshot_path = snapshot_path
+        self.default_leads = default_leads or DEFAULT_LEAD_MINUTES
+        self.user_leads = user_leads or {}
+        self.heap = []
+        self.reminders = {}
+        self.by_event = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self.reminders)
+
+    def leads_for(self, user_email):
+        return self.user_leads.get(user_email, self.default_leads)
+
+    def _push(self, key, due, event):
+        entry_id = next(self.counter)
+        self.reminders[key] = {"due": due, "entry": entry_id, "event": event}
+        self.by_event.setdefault(key[:2], set()).add(key)
+        heapq.heappush(self.heap, (due, entry_id, key))
+        self.dirty = True
+
+    def _drop(self, key):
+        self.reminders.pop(key, None)
+        keys = self.by_event.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_event[key[:2]]
+        self.dirty = True
+
+    def upsert(self, event, now=None):
+        """Insert or reschedule every reminder of a feed event."""
+        now = now or time.time()
+        start = event_start(event)
+        event_key = (event["id"], event["user_email"])
+
+        wanted = {}
+        if start is not None and start > now:
+            # When several leads are already overdue only the closest one is kept
+            leads = sorted(self.leads_for(event["user_email"]))
+            overdue = [lead for lead in leads if start - lead * 60 <= now]
+            for lead in leads:
+                if lead not in overdue or lead == overdue[0]:
+                    wanted[event_key + (lead,)] = start - lead * 60
+
+        with self.lock:
+            for key in list(self.by_event.get(event_key, ())):
+                if key not in wanted or self.reminders[key]["due"] != wanted[key]:
+                    self._drop(key)
+            for key, due in wanted.items():
+                if key in self.reminders:
+                    # Same due time, only refresh the event details
+                    self.reminders[key]["event"] = event
+                    self.dirty = True
+                else:
+                    self._push(key, due, event)
+
+            # Too many stale entries left by updates: rebuild the heap
+            if len(self.heap) > 2 * len(self.reminders) + 64:
+                self.heap = [(r["due"], r["entry"], key) for key, r in self.reminders.items()]
+                heapq.heapify(self.heap)
+
+    def remove(self, event_id, user_email):
+        with self.lock:
+            for key in list(self.by_event.get((event_id, user_email), ())):
+                self._drop(key)
+
+    def replace_all(self, events, now=None):
+        """Reconcile with a full feed snapshot: unknown events are dropped."""
+        alive = {(event["id"], event["user_email"]) for event in events}
+        with self.lock:
+            gone = [event_key for event_key in self.by_event if event_key not in alive]
+        for event_id, user_email in gone:
+            self.remove(event_id, user_email)
+        for event in events:
+            self.upsert(event, now)
+
+    def pop_due(self, horizon, now=None):
+        """Pop reminders due before horizon, as (lead, due, event) tuples.
+
+        Reminders whose event already started are dropped instead of fired.
+        """
+        now = now or time.time()
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= horizon:
+                due_at, entry_id, key = heapq.heappop(self.heap)
+                reminder = self.reminders.get(key)
+                # Stale entry left behind by an update or a removal
+                if reminder is None or reminder["entry"] != entry_id:
+                    continue
+                self._drop(key)
+                if event_start(reminder["event"]) > now:
+                    due.append((key[2], due_at, reminder["event"]))
+        return due
+
+    def push_back(self, lead, due, event):
+        """Re-queue a reminder that could not be sent."""
+        with self.lock:
+            self._push((event["id"], event["user_email"], lead), due, event)
+
+    def load(self):
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r") as file:
+                snapshot = json.load(file)
+        except ValueError:
+            print(f"[WARNING] Reminder snapshot {self.snapshot_path} is corrupted, starting empty")
+            return
+
+        for item in snapshot:
+            self._push((item["event"]["id"], item["event"]["user_email"], item["lead"]), item["due"], item["event"])
+        self.dirty = False
+        print(f"[INFO] {len(self.reminders)} reminder(s) restored from snapshot")
+
+    def save(self):
+        """Atomically write the pending reminders if anything changed."""
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = [
+                {"lead": key[2], "due": reminder["due"], "event": reminder["event"]}
+                for key, reminder in self.reminders.items()
+            ]
+            self.dirty = False
+
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(snapshot, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+
+def load_lead_config(path):
+    """Read {"default": [minutes...], "users": {email: [minutes...]}} if the file exists."""
+    if not path or not os.path.exists(path):
+        return None, None
+    with open(path, "r") as file:
+        config = json.load(file)
+    return config.get("default"), config.get("users")
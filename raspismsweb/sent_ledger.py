@@ -0,0 +1,153 @@
+import json
+import os
+import time
+from datetime import datetime
+
+
+# Keep records this long after the event ended before forgetting them
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+# Rewrite the file without expired records this often
+DEFAULT_COMPACT_INTERVAL = 24 * 3600
+
+
+def event_timestamp(value):
+    """Convert an event "start"/"end" value (ISO datetime or date) to an epoch timestamp."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (ValueError, AttributeError):
+        return None
+
+
+def event_start(event):
+    """Start of a feed event, from the start_ts computed by the feed when present."""
+    start = event.get("start_ts")
+    return start if start is not None else event_timestamp(event.get("start"))
+
+
+class SentLedger:
+    """Append-only JSON lines log of sent SMS with an in-memory index.
+
+    Every line is one {"event_id", "user_email", "sent_at", "end"} record.
+    Lookups are O(1) set checks, appends are fsynced so a crash can at worst
+    lose a half written last line. The file is compacted on startup and
+    then every compact_interval seconds through compact_if_due().
+    """
+
+    def __init__(self, path, retention=DEFAULT_RETENTION_SECONDS, compact_interval=DEFAULT_COMPACT_INTERVAL):
+        self.path = path
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.compacted_at = 0
+        self.sent = set()
+        self.expires = {}
+        self.file = None
+        self.compact()
+
+    def __contains__(self, key):
+        return key in self.sent
+
+    def __len__(self):
+        return len(self.sent)
+
+    def _index(self, record):
+        key = (record["event_id"], record["user_email"])
+        self.sent.add(key)
+        end = record.get("end") or record.get("sent_at") or time.time()
+        # An event can be recorded several times, keep the latest end
+        self.expires[record["event_id"]] = max(end, self.expires.get(record["event_id"], 0))
+
+    def _read_records(self):
+        if not os.path.exists(self.path):
+            return []
+
+        with open(self.path, "r") as file:
+            content = file.read()
+
+        # Old format: one JSON object {event_id: [user_email, ...]}
+        try:
+            legacy = json.loads(content)
+        except ValueError:
+            legacy = None
+        if isinstance(legacy, dict) and all(isinstance(v, list) for v in legacy.values()):
+            now = time.time()
+            return [
+                {"event_id": event_id, "user_email": user_email, "sent_at": now, "end": None}
+                for event_id, emails in legacy.items()
+                for user_email in emails
+            ]
+
+        records = []
+        for line in content.splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Torn write from a crash, the record was never confirmed
+                print(f"[WARNING] Skipping corrupted ledger line: {line[:80]}")
+        return records
+
+    def compact(self, now=None):
+        """Reload the ledger, drop expired events and rewrite the file atomically."""
+        now = now or time.time()
+        self.close()
+        self.sent.clear()
+        self.expires.clear()
+
+        for record in self._read_records():
+            self._index(record)
+        expired = {event_id for event_id, end in self.expires.items() if end + self.retention < now}
+        self.sent = {key for key in self.sent if key[0] not in expired}
+        for event_id in expired:
+            del self.expires[event_id]
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            for event_id, user_email in self.sent:
+                record = {"event_id": event_id, "user_email": user_email, "end": self.expires[event_id]}
+                file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+        if expired:
+            print(f"[INFO] Ledger compacted, {len(expired)} expired event(s) evicted")
+        self.file = open(self.path, "a")
+        self.compacted_at = now
+
+    def compact_if_due(self, now=None):
+        """Compact when the last compaction is older than compact_interval."""
+        now = now or time.time()
+        if now - self.compacted_at >= self.compact_interval:
+            self.compact(now)
+
+    def add_many(self, entries):
+        """Durably record (event_id, user_email, end) entries with a single fsync."""
+        now = time.time()
+        lines = []
+        for event_id, user_email, end in entries:
+            if (event_id, user_email) in self.sent:
+                continue
+            record = {
+                "event_id": event_id,
+                "user_email": user_email,
+                "sent_at": now,
+                "end": event_timestamp(end),
+            }
+            lines.append(json.dumps(record) + "\n")
+            self._index(record)
+
+        if lines:
+            self.file.write("".join(lines))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def add(self, event_id, user_email, end=None):
+        self.add_many([(event_id, user_email, end)])
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
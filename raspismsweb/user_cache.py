@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event
+
+
+CachedUser = namedtuple("CachedUser", ["id", "email", "phone_number"])
+
+# Stay well below the SQLite bound parameter limit
+IN_QUERY_CHUNK = 500
+
+
+class UserCache:
+    """Small TTL + LRU cache of email -> CachedUser in front of the User table."""
+
+    def __init__(self, model, ttl=600, max_size=5000):
+        self.model = model
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get(self, email, now):
+        entry = self.entries.get(email)
+        if entry is None:
+            return False, None
+        expires, user = entry
+        if expires < now:
+            del self.entries[email]
+            return False, None
+        self.entries.move_to_end(email)
+        return True, user
+
+    def _put(self, email, user, now):
+        self.entries[email] = (now + self.ttl, user)
+        self.entries.move_to_end(email)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def resolve(self, emails):
+        """Return {email: CachedUser or None}, loading every miss in one IN (...) query.
+
+        Unknown emails are not cached, so a user who registers later is found
+        on the next call.
+        """
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self.lock:
+            for email in set(emails):
+                hit, user = self._get(email, now)
+                if hit:
+                    found[email] = user
+                else:
+                    missing.append(email)
+
+        loaded = {}
+        for i in range(0, len(missing), IN_QUERY_CHUNK):
+            chunk = missing[i:i + IN_QUERY_CHUNK]
+            for user in self.model.query.filter(self.model.email.in_(chunk)).all():
+                loaded[user.email] = CachedUser(user.id, user.email, user.phone_number)
+
+        with self.lock:
+            for email in missing:
+                found[email] = loaded.get(email)
+                if found[email] is not None:
+                    self._put(email, found[email], now)
+        return found
+
+    def invalidate(self, email):
+        with self.lock:
+            self.entries.pop(email, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def watch(self):
+        """Drop cached entries as soon as a user's email or phone number is modified."""
+        @event.listens_for(self.model.phone_number, "set")
+        def on_phone_change(target, value, oldvalue, initiator):
+            if value != oldvalue:
+                self.invalidate(target.email)
+
+        @event.listens_for(self.model.email, "set")
+        def on_email_change(target, value, oldvalue, initiator):
+            if value != oldvalue:
+                self.invalidate(oldvalue)
+                self.invalidate(value)
+
+        @event.listens_for(self.model, "after_delete")
+        def on_delete(mapper, connection, target):
+            self.invalidate(target.email)
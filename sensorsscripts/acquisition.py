@@ -0,0 +1,154 @@
+import os
+import signal
+import time
+from collections import namedtuple
+from aggregation import dht22_aggregator
+from sensors import sensor_factory
+from sinks import AzureSink, FileSink, MqttSink, TimeSeriesSink
+
+
+# MQTT Broker Configuration
+MQTT_BROKER = os.getenv("MQTT_BROKER", "127.0.0.1")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+MQTT_TOPICS = {"temperature": "home/temperature", "humidity": "home/humidity"}
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "raspberry_dht22")  # Unique client ID
+# JSON of both values and their rolling stats, next to the per-metric topics
+MQTT_COMBINED_TOPIC = os.getenv("MQTT_COMBINED_TOPIC", "home/climate")
+MQTT_LEGACY_TOPICS = os.getenv("MQTT_LEGACY_TOPICS", "1") == "1"
+
+SAMPLE_INTERVAL = float(os.getenv("SAMPLE_INTERVAL", 10))
+# dht22[:pin], synthetic or replay:<csv or jsonl file>
+SENSOR_DRIVER = os.getenv("SENSOR_DRIVER", "dht22")
+# A value is published when it moves past its deadband, or at least every HEARTBEAT_SECONDS
+DEADBAND_TEMPERATURE = float(os.getenv("DEADBAND_TEMPERATURE", 0.2))
+DEADBAND_HUMIDITY = float(os.getenv("DEADBAND_HUMIDITY", 1.0))
+HEARTBEAT_SECONDS = float(os.getenv("HEARTBEAT_SECONDS", 300))
+AGGREGATION_WINDOW = int(os.getenv("AGGREGATION_WINDOW", 30))
+CONNECTION_STRING = os.getenv("AZURE_IOT_HUB_CONNECTION_STRING")
+# Azure batches wait here until IoT Hub acknowledged them
+TELEMETRY_SPOOL_DIR = os.getenv("TELEMETRY_SPOOL_DIR", os.path.expanduser("~/.dht22-telemetry"))
+AZURE_BATCH_READINGS = int(os.getenv("AZURE_BATCH_READINGS", 30))
+AZURE_BATCH_SECONDS = float(os.getenv("AZURE_BATCH_SECONDS", 300))
+READINGS_FILE = os.getenv("READINGS_FILE")
+# Local history of every plausible reading, queried on 127.0.0.1:TIMESERIES_PORT (empty: no API)
+TIMESERIES_DIR = os.getenv("TIMESERIES_DIR", os.path.expanduser("~/.dht22-timeseries"))
+TIMESERIES_RETENTION_DAYS = int(os.getenv("TIMESERIES_RETENTION_DAYS", 30))
+TIMESERIES_PORT = os.getenv("TIMESERIES_PORT", "8090")
+
+Reading = namedtuple("Reading", "sensor timestamp temperature humidity")
+
+
+class Acquisition:
+    """Sample one sensor at a fixed interval and fan readings out to the sinks.
+
+    This is the only place the sensor is read, every consumer is a sink.
+    Offering a reading never blocks, so sampling keeps its pace whatever
+    the sinks are doing. With an aggregator, only the readings it lets
+    through (no outliers, moved past the deadband) reach the sinks, except
+    raw sinks which get every reading that isn't an outlier.
+    """
+
+    def __init__(self, open_sensor, sinks, interval=SAMPLE_INTERVAL, name="dht22", aggregator=None):
+        self.open_sensor = open_sensor
+        self.sinks = sinks
+        self.aggregator = aggregator
+        self.interval = interval
+        self.name = name
+        self.device = None
+        self.running = False
+
+    def read(self):
+        """One reading, or None if the sensor didn't answer."""
+        try:
+            temperature, humidity = self.device.read()
+        except RuntimeError as e:
+            # DHT22 reads fail regularly, the next sample usually works
+            print(f"Error reading sensor: {e}. Retrying...")
+            return None
+        except OSError as e:
+            print(f"OS error with sensor: {e}. Restarting sensor...")
+            self.device.close()
+            time.sleep(2)
+            self.device = self.open_sensor()
+            return None
+
+        if temperature is None or humidity is None:
+            print(f"Failed to retrieve data from sensor {self.name}")
+            return None
+        return Reading(self.name, time.time(), temperature, humidity)
+
+    def publish(self, reading, update):
+        for sink in self.sinks:
+            if sink.raw:
+                sink.offer(reading)
+            elif update:
+                sink.offer(update)
+
+    def run(self):
+        self.device = self.open_sensor()
+        for sink in self.sinks:
+            sink.start()
+
+        self.running = True
+        next_sample = time.monotonic()
+        try:
+            while self.running:
+                try:
+                    reading = self.read()
+                    if reading and (not self.aggregator or self.aggregator.accept(reading)):
+                        print(f"Temp: {reading.temperature:.1f}°C, Humidity: {reading.humidity:.1f}%")
+                        update = self.aggregator.gate(reading) if self.aggregator else reading
+                        self.publish(reading, update)
+                except Exception as e:
+                    # A bad driver or aggregation bug loses this sample, not the daemon
+                    print(f"Unexpected error: {e}")
+
+                # Fixed cadence, the time spent reading doesn't shift the next sample
+                next_sample += self.interval
+                time.sleep(max(0, next_sample - time.monotonic()))
+        finally:
+            print("Cleaning up...")
+            for sink in self.sinks:
+                sink.stop()
+            self.device.close()
+
+    def stop(self, *args):
+        self.running = False
+
+
+def build_sinks(mqtt=True, azure=None, readings_file=None, timeseries=True):
+    """Sinks enabled by default from the environment."""
+    sinks = []
+    if timeseries:
+        # numpy is only needed for the store
+        from timeseries import TimeSeriesStore, serve_http
+        store = TimeSeriesStore(TIMESERIES_DIR, TIMESERIES_RETENTION_DAYS)
+        sinks.append(TimeSeriesSink(store))
+        if TIMESERIES_PORT:
+            serve_http(store, int(TIMESERIES_PORT))
+    if mqtt:
+        topics = MQTT_TOPICS if MQTT_LEGACY_TOPICS else {}
+        sinks.append(MqttSink(MQTT_BROKER, MQTT_PORT, MQTT_CLIENT_ID, topics, MQTT_COMBINED_TOPIC))
+    if azure is None:
+        azure = bool(CONNECTION_STRING)
+    if azure:
+        sinks.append(AzureSink(CONNECTION_STRING, TELEMETRY_SPOOL_DIR, batch_readings=AZURE_BATCH_READINGS,
+                               batch_seconds=AZURE_BATCH_SECONDS))
+    readings_file = readings_file or READINGS_FILE
+    if readings_file:
+        sinks.append(FileSink(readings_file))
+    return sinks
+
+
+def main(**sink_options):
+    aggregator = dht22_aggregator(DEADBAND_TEMPERATURE, DEADBAND_HUMIDITY, HEARTBEAT_SECONDS, AGGREGATION_WINDOW)
+    acquisition = Acquisition(sensor_factory(SENSOR_DRIVER), build_sinks(**sink_options), aggregator=aggregator)
+    signal.signal(signal.SIGTERM, acquisition.stop)
+    try:
+        acquisition.run()
+    except KeyboardInterrupt:
+        print("Exiting...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+from array import array
+from collections import namedtuple
+
+
+# A reading that made it through aggregation: changed lists the metrics that
+# moved past their deadband (or whose heartbeat expired), stats holds the
+# rolling min/max/mean/std of each metric
+Update = namedtuple("Update", "sensor timestamp temperature humidity changed stats")
+
+
+class RingBuffer:
+    """Fixed-size window of floats in an array, with running sums for mean/std."""
+
+    def __init__(self, size):
+        self.values = array("d", [0.0]) * size
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.index = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        if self.count == self.size:
+            old = self.values[self.index]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.count += 1
+        self.values[self.index] = value
+        self.total += value
+        self.total_sq += value * value
+        self.index = (self.index + 1) % self.size
+        if self.index == 0:
+            # Running sums drift with float rounding, start again from the values once per lap
+            self.total = sum(self.values)
+            self.total_sq = sum(v * v for v in self.values)
+
+    def window(self):
+        """Values in the window, not in arrival order."""
+        return self.values if self.count == self.size else self.values[:self.count]
+
+    def mean(self):
+        return self.total / self.count
+
+    def std(self):
+        mean = self.mean()
+        return max(0.0, self.total_sq / self.count - mean * mean) ** 0.5
+
+    def stats(self):
+        if not self.count:
+            return None
+        window = self.window()
+        return {"min": min(window), "max": max(window),
+                "mean": round(self.mean(), 2), "std": round(self.std(), 3)}
+
+
+class MetricStream:
+    """Outlier filter and deadband/heartbeat gate for one metric.
+
+    A value outside limits is always rejected. A value further than
+    outlier_sigma standard deviations (and at least outlier_floor) from
+    the rolling mean is rejected too, unless it happens max_rejects times
+    in a row: then it is a real step and the window starts over.
+    """
+
+    def __init__(self, name, deadband, limits, window=30, heartbeat=300,
+                 outlier_sigma=4.0, outlier_floor=2.0, max_rejects=3, min_samples=5):
+        self.name = name
+        self.deadband = deadband
+        self.limits = limits
+        self.window = RingBuffer(window)
+        self.heartbeat = heartbeat
+        self.outlier_sigma = outlier_sigma
+        self.outlier_floor = outlier_floor
+        self.max_rejects = max_rejects
+        self.min_samples = min_samples
+
+        self.rejects = 0
+        self.rejected = 0
+        self.last_value = None
+        self.last_time = None
+
+    def check(self, value):
+        """True if value is plausible, False if it looks like a sensor glitch."""
+        low, high = self.limits
+        if not low <= value <= high:
+            self.rejected += 1
+            return False
+
+        if len(self.window) >= self.min_samples:
+            distance = abs(value - self.window.mean())
+            if distance > max(self.outlier_sigma * self.window.std(), self.outlier_floor):
+                self.rejects += 1
+                if self.rejects <= self.max_rejects:
+                    self.rejected += 1
+                    return False
+                self.window.clear()
+        self.rejects = 0
+        return True
+
+    def due(self, value, now):
+        """True if value must be published, and remember it as the last published one."""
+        if (self.last_value is None or abs(value - self.last_value) >= self.deadband
+                or now - self.last_time >= self.heartbeat):
+            self.last_value = value
+            self.last_time = now
+            return True
+        return False
+
+
+class Aggregator:
+    """Filter readings and only let through the ones worth publishing."""
+
+    def __init__(self, streams):
+        self.streams = {stream.name: stream for stream in streams}
+
+    def accept(self, reading):
+        """False if the reading is an outlier, else add it to the rolling windows."""
+        values = {name: getattr(reading, name) for name in self.streams}
+        glitches = [name for name, stream in self.streams.items() if not stream.check(values[name])]
+        if glitches:
+            # Both values come from the same DHT22 frame, drop them together
+            print(f"Outlier dropped ({', '.join(glitches)}): "
+                  f"{', '.join(f'{name}={value}' for name, value in values.items())}")
+            return False
+
+        for name, stream in self.streams.items():
+            stream.window.append(values[name])
+        return True
+
+    def process(self, reading):
+        """Update for the reading, or None if it is an outlier or nothing moved."""
+        if not self.accept(reading):
+            return None
+        return self.gate(reading)
+
+    def gate(self, reading):
+        """Update for an accepted reading, or None if no metric is due for publishing."""
+        changed = []
+        for name, stream in self.streams.items():
+            if stream.due(getattr(reading, name), reading.timestamp):
+                changed.append(name)
+        if not changed:
+            return None
+
+        stats = {name: stream.window.stats() for name, stream in self.streams.items()}
+        return Update(reading.sensor, reading.timestamp, reading.temperature, reading.humidity, changed, stats)
+
+
+def dht22_aggregator(temperature_deadband=0.2, humidity_deadband=1.0, heartbeat=300, window=30):
+    """Aggregator with the DHT22 measuring range as hard limits."""
+    return Aggregator([
+        MetricStream("temperature", temperature_deadband, (-40, 80), window, heartbeat, outlier_floor=2.0),
+        MetricStream("humidity", humidity_deadband, (0, 100), window, heartbeat, outlier_floor=5.0),
+    ])
@@ -0,0 +1,114 @@
+import csv
+import json
+import math
+import random
+import time
+
+
+class Sensor:
+    """Temperature/humidity source. read() returns (temperature, humidity).
+
+    Like the DHT22, read() may raise RuntimeError for a missed frame or
+    OSError when the device must be reopened, and may return None values.
+    """
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DHT22Sensor(Sensor):
+    """The real DHT22, hardware libraries are only imported when it is opened."""
+
+    def __init__(self, pin="D4"):
+        import adafruit_dht
+        import board
+        self.device = adafruit_dht.DHT22(getattr(board, pin))
+
+    def read(self):
+        return self.device.temperature, self.device.humidity
+
+    def close(self):
+        self.device.exit()
+
+
+class SyntheticSensor(Sensor):
+    """Slow daily sine around a base value, gaussian noise and injected failures."""
+
+    def __init__(self, temperature=21.0, humidity=45.0, amplitude=2.0, noise=0.1,
+                 runtime_error_rate=0.0, os_error_rate=0.0, period=86400, seed=None):
+        self.temperature = temperature
+        self.humidity = humidity
+        self.amplitude = amplitude
+        self.noise = noise
+        self.runtime_error_rate = runtime_error_rate
+        self.os_error_rate = os_error_rate
+        self.period = period
+        self.random = random.Random(seed)
+        self.phase = self.random.uniform(0, 2 * math.pi)
+
+    def read(self):
+        draw = self.random.random()
+        if draw < self.os_error_rate:
+            raise OSError("synthetic sensor unplugged")
+        if draw < self.os_error_rate + self.runtime_error_rate:
+            raise RuntimeError("synthetic checksum error")
+
+        wave = math.sin(2 * math.pi * time.time() / self.period + self.phase)
+        temperature = self.temperature + self.amplitude * wave + self.random.gauss(0, self.noise)
+        humidity = self.humidity - 2 * self.amplitude * wave + self.random.gauss(0, 3 * self.noise)
+        # Same resolution as the DHT22
+        return round(temperature, 1), round(min(100.0, max(0.0, humidity)), 1)
+
+
+class ReplaySensor(Sensor):
+    """Replay recorded readings from a CSV or JSON lines file.
+
+    Rows need temperature and humidity columns/keys (a JSON lines file
+    written by FileSink works). Empty values replay as a failed read.
+    """
+
+    def __init__(self, path, loop=True):
+        self.path = path
+        self.loop = loop
+        self.rows = self.load(path)
+        if not self.rows:
+            raise ValueError(f"No readings in {path}")
+        self.position = 0
+
+    @staticmethod
+    def load(path):
+        with open(path, "r", newline="") as file:
+            if path.endswith(".csv"):
+                records = list(csv.DictReader(file))
+            else:
+                records = [json.loads(line) for line in file if line.strip()]
+
+        def value(record, key):
+            raw = record.get(key)
+            return float(raw) if raw not in (None, "") else None
+
+        return [(value(record, "temperature"), value(record, "humidity")) for record in records]
+
+    def read(self):
+        if self.position == len(self.rows):
+            if not self.loop:
+                return None, None
+            self.position = 0
+        row = self.rows[self.position]
+        self.position += 1
+        return row
+
+
+def sensor_factory(spec, seed=None):
+    """Factory for a SENSOR_DRIVER spec: dht22[:pin], synthetic or replay:<path>."""
+    kind, _, argument = spec.partition(":")
+    if kind == "dht22":
+        return lambda: DHT22Sensor(argument or "D4")
+    if kind == "synthetic":
+        return lambda: SyntheticSensor(runtime_error_rate=0.05, os_error_rate=0.001, seed=seed)
+    if kind == "replay":
+        return lambda: ReplaySensor(argument)
+    raise ValueError(f"Unknown sensor driver {spec!r}")
@@ -0,0 +1,217 @@
+import json
+import os
+import queue
+import threading
+import paho.mqtt.client as mqtt
+from telemetry import TelemetryUplink, azure_message
+
+
+class Sink:
+    """Destination of sensor readings, drained by its own worker thread.
+
+    Readings are offered without ever blocking the sampling loop: each sink
+    has a bounded queue and drops its oldest reading when full. A failing
+    send is retried by the worker, so a slow or unreachable sink only
+    delays (or drops) its own readings.
+    """
+
+    name = "sink"
+    # True: gets every plausible reading instead of the aggregated updates
+    raw = False
+
+    def __init__(self, maxsize=100, retry_delay=5):
+        self.queue = queue.Queue(maxsize)
+        self.retry_delay = retry_delay
+        self.dropped = 0
+        self.sent = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"sink-{self.name}", daemon=True)
+
+    def start(self):
+        self.open()
+        self.thread.start()
+        return self
+
+    def offer(self, reading):
+        """Queue a reading, dropping the oldest queued one when full."""
+        while True:
+            try:
+                self.queue.put_nowait(reading)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        # Keep draining on stop so queued readings still get out
+        while not (self.stopping.is_set() and self.queue.empty()):
+            try:
+                reading = self.queue.get(timeout=1)
+            except queue.Empty:
+                self.safe_tick()
+                continue
+
+            while True:
+                try:
+                    self.handle(reading)
+                    self.sent += 1
+                    break
+                except Exception as e:
+                    print(f"[{self.name}] Failed to send reading: {e}")
+                    if self.stopping.wait(self.retry_delay):
+                        break
+            self.safe_tick()
+
+    def safe_tick(self):
+        try:
+            self.tick()
+        except Exception as e:
+            print(f"[{self.name}] Error: {e}")
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        self.thread.join(timeout)
+        self.close()
+        if self.dropped:
+            print(f"[{self.name}] {self.dropped} reading(s) dropped, queue was full")
+
+    def open(self):
+        pass
+
+    def handle(self, reading):
+        raise NotImplementedError
+
+    def tick(self):
+        """Called by the worker at least once a second, for time based work."""
+        pass
+
+    def close(self):
+        pass
+
+
+class MqttSink(Sink):
+    """Publish readings to the local broker.
+
+    Each metric goes to its own topic, only when it changed if the reading
+    comes from the aggregator. The whole reading (with its rolling stats)
+    goes as JSON to combined_topic.
+    """
+
+    name = "mqtt"
+
+    def __init__(self, broker, port, client_id, topics, combined_topic=None, **kwargs):
+        super().__init__(**kwargs)
+        self.broker = broker
+        self.port = port
+        # metric name -> topic, e.g. {"temperature": "home/temperature"}
+        self.topics = topics
+        self.combined_topic = combined_topic
+        self.client = mqtt.Client(client_id=client_id, callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
+        self.client.on_connect = self.on_connect
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            print("Connected to MQTT broker")
+        else:
+            print(f"Connection to MQTT broker failed with code {rc}")
+
+    def open(self):
+        # Doesn't block if the broker is down, the network loop keeps retrying
+        self.client.connect_async(self.broker, self.port, 60)
+        self.client.loop_start()
+
+    def publish(self, topic, payload):
+        info = self.client.publish(topic, payload)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise RuntimeError(f"publish to {topic} failed: {mqtt.error_string(info.rc)}")
+
+    def handle(self, reading):
+        changed = getattr(reading, "changed", self.topics)
+        for metric, topic in self.topics.items():
+            if metric in changed:
+                self.publish(topic, f"{getattr(reading, metric):.1f}")
+        if self.combined_topic:
+            self.publish(self.combined_topic, json.dumps(reading._asdict()))
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class AzureSink(Sink):
+    """Send readings to Azure IoT Hub as gzipped batches, spooled on disk.
+
+    client can be any object with send_message(message) and shutdown(),
+    e.g. a local stand-in; make_message turns a gzipped batch into the
+    message it expects.
+    """
+
+    name = "azure"
+
+    def __init__(self, connection_string, spool_dir, client=None, make_message=azure_message,
+                 batch_readings=30, batch_seconds=300, replay_rate=1.0, **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            from azure.iot.device import IoTHubDeviceClient
+            client = IoTHubDeviceClient.create_from_connection_string(connection_string)
+        self.client = client
+        self.make_message = make_message
+        self.uplink = TelemetryUplink(self.send_batch, spool_dir, max_readings=batch_readings,
+                                      max_age=batch_seconds, replay_rate=replay_rate)
+
+    def send_batch(self, payload):
+        self.client.send_message(self.make_message(payload))
+
+    def handle(self, reading):
+        self.uplink.add(reading)
+
+    def tick(self):
+        self.uplink.poll()
+
+    def close(self):
+        # The open batch goes to disk and is sent after the restart
+        self.uplink.flush()
+        self.client.shutdown()
+
+
+class FileSink(Sink):
+    """Append readings to a local JSON lines file."""
+
+    name = "file"
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.file = None
+
+    def open(self):
+        self.file = open(self.path, "a")
+
+    def handle(self, reading):
+        self.file.write(json.dumps(reading._asdict()) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+
+class TimeSeriesSink(Sink):
+    """Keep every reading in the local time-series store."""
+
+    name = "timeseries"
+    raw = True
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def handle(self, reading):
+        self.store.append(reading.sensor, reading.timestamp, reading.temperature, reading.humidity)
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,231 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+
+# Reading of the open batch read back from disk after a restart
+SpooledReading = namedtuple("SpooledReading", "timestamp temperature humidity")
+
+
+class DiskRingBuffer:
+    """Bounded FIFO of byte records kept on disk, one file per record.
+
+    Records survive restarts and are read back oldest first. When the
+    buffer is full the oldest record is deleted to make room.
+    """
+
+    SUFFIX = ".batch"
+
+    def __init__(self, directory, max_records):
+        self.directory = directory
+        self.max_records = max_records
+        self.dropped = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        seqs = []
+        for name in os.listdir(directory):
+            if name.endswith(self.SUFFIX):
+                seqs.append(int(name[:-len(self.SUFFIX)]))
+            elif name.endswith(".tmp"):
+                # Interrupted write, the record was never acknowledged
+                os.remove(os.path.join(directory, name))
+        self.seqs = deque(sorted(seqs))
+        self.next_seq = self.seqs[-1] + 1 if self.seqs else 0
+
+    def __len__(self):
+        return len(self.seqs)
+
+    def path(self, seq):
+        return os.path.join(self.directory, f"{seq:012d}{self.SUFFIX}")
+
+    def push(self, data):
+        with self.lock:
+            path = self.path(self.next_seq)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+            self.seqs.append(self.next_seq)
+            self.next_seq += 1
+
+            while len(self.seqs) > self.max_records:
+                os.remove(self.path(self.seqs.popleft()))
+                self.dropped += 1
+
+    def peek(self):
+        """(seq, data) of the oldest record, or None when empty."""
+        with self.lock:
+            if not self.seqs:
+                return None
+            seq = self.seqs[0]
+            with open(self.path(seq), "rb") as file:
+                return seq, file.read()
+
+    def pop(self, seq):
+        """Delete the oldest record once it has been delivered."""
+        with self.lock:
+            if self.seqs and self.seqs[0] == seq:
+                self.seqs.popleft()
+                os.remove(self.path(seq))
+
+
+def encode_batch(device, readings):
+    """Gzipped JSON of a batch, readings as compact [timestamp, temperature, humidity] rows."""
+    body = {
+        "device": device,
+        "fields": ["timestamp", "temperature", "humidity"],
+        "readings": [[round(r.timestamp, 1), r.temperature, r.humidity] for r in readings],
+    }
+    return gzip.compress(json.dumps(body, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_batch(payload):
+    return json.loads(gzip.decompress(payload))
+
+
+class TelemetryUplink:
+    """Batch readings, spool the batches to disk and send them in order.
+
+    Each reading is appended and fsynced to the open segment file as it
+    arrives. A batch is closed after max_readings readings or max_age
+    seconds and sealed into the ring buffer before any send is attempted,
+    so nothing is lost while the link is down or across a power cut: the
+    open segment is read back on startup. send(payload) must
+    raise on failure; the oldest batch is then retried with exponential
+    backoff. A backlog is replayed at most replay_rate batches per second.
+    """
+
+    def __init__(self, send, spool_dir, device="dht22", max_readings=30, max_age=300,
+                 max_batches=4000, replay_rate=1.0, retry_delay=5, max_retry_delay=300):
+        self.send = send
+        self.buffer = DiskRingBuffer(spool_dir, max_batches)
+        self.device = device
+        self.max_readings = max_readings
+        self.max_age = max_age
+        self.replay_interval = 1 / replay_rate
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.open_path = os.path.join(spool_dir, "open.readings")
+        self.open_file = None
+        self.batch = self.recover_open()
+        self.batch_started = None
+        if self.batch:
+            self.batch_started = time.monotonic()
+            self.open_segment()
+        self.failures = 0
+        self.next_attempt = 0
+        self.sent_batches = 0
+        self.sent_bytes = 0
+
+    @staticmethod
+    def reading_line(reading):
+        return json.dumps([reading.timestamp, reading.temperature, reading.humidity]) + "\n"
+
+    def recover_open(self):
+        """Readings of the batch that was still open when the process stopped."""
+        try:
+            with open(self.open_path, "r") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return []
+        if not lines:
+            return []
+
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = {}
+        if header.get("seq") in self.buffer.seqs:
+            # Sealed right before the stop, only removing the segment was missing
+            return []
+
+        readings = []
+        for line in lines[1:]:
+            try:
+                readings.append(SpooledReading(*json.loads(line)))
+            except (ValueError, TypeError):
+                # Torn last line, that reading was never acknowledged
+                continue
+        if readings:
+            print(f"[azure] {len(readings)} reading(s) of the open batch recovered")
+        return readings
+
+    def open_segment(self):
+        """Start the open segment file with the seq the batch will be sealed as."""
+        tmp_path = f"{self.open_path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(json.dumps({"seq": self.buffer.next_seq}) + "\n")
+            file.writelines(self.reading_line(reading) for reading in self.batch)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.open_path)
+        self.open_file = open(self.open_path, "a")
+
+    def add(self, reading):
+        if not self.batch:
+            self.batch_started = time.monotonic()
+            self.open_segment()
+        # On disk first: if the write fails the sink retries without a duplicate
+        self.open_file.write(self.reading_line(reading))
+        self.open_file.flush()
+        os.fsync(self.open_file.fileno())
+        self.batch.append(reading)
+
+    def flush(self):
+        """Close the current batch and seal it into the ring buffer."""
+        if self.batch:
+            self.buffer.push(encode_batch(self.device, self.batch))
+            self.batch = []
+            # A stop between push and remove is detected by the seq in the segment header
+            self.open_file.close()
+            self.open_file = None
+            os.remove(self.open_path)
+
+    def poll(self, budget=1.0):
+        """Close a full or expired batch, then send spooled batches for up to budget seconds.
+
+        Consecutive sends are spaced by 1 / replay_rate seconds.
+        """
+        now = time.monotonic()
+        if len(self.batch) >= self.max_readings or (self.batch and now - self.batch_started >= self.max_age):
+            self.flush()
+
+        deadline = now + budget
+        while True:
+            if self.failures and now < self.next_attempt:
+                return  # backing off after a failure
+            if self.next_attempt > deadline:
+                return  # replay rate used up for this poll
+            record = self.buffer.peek()
+            if record is None:
+                return
+            time.sleep(max(0, self.next_attempt - now))
+
+            seq, payload = record
+            try:
+                self.send(payload)
+            except Exception as e:
+                self.failures += 1
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (self.failures - 1))
+                self.next_attempt = time.monotonic() + delay
+                print(f"[azure] Send failed ({e}), {len(self.buffer)} batch(es) waiting, retry in {delay:.0f}s")
+                return
+
+            self.buffer.pop(seq)
+            self.failures = 0
+            self.sent_batches += 1
+            self.sent_bytes += len(payload)
+            now = time.monotonic()
+            self.next_attempt = now + self.replay_interval
+
+def azure_message(payload):
+    """IoT Hub message carrying a gzipped JSON batch."""
+    from azure.iot.device import Message
+    return Message(payload, content_encoding="gzip", content_type="application/json")
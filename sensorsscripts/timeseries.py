@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+
+
+# Fixed-width 16 byte record, segment files are plain arrays of it
+RECORD = np.dtype([("timestamp", "<f8"), ("temperature", "<f4"), ("humidity", "<f4")])
+METRICS = ("temperature", "humidity")
+
+
+class TimeSeriesStore:
+    """Readings kept on the Pi in memory-mapped segment files.
+
+    Each sensor has a directory of segments, one per segment_seconds (a
+    day by default) named after their start time. Records are appended in
+    time order, so a query maps the segments it overlaps and binary
+    searches them; segments older than the retention are deleted when a
+    new one is started.
+    """
+
+    SUFFIX = ".ts"
+
+    def __init__(self, directory, retention_days=30, segment_seconds=86400):
+        self.directory = directory
+        self.retention = retention_days * 86400
+        self.segment_seconds = segment_seconds
+        # sensor -> {"start", "file", "last"} of the segment being written
+        self.writers = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def sensors(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def segment_path(self, sensor, start):
+        return os.path.join(self.directory, sensor, f"{start:010d}{self.SUFFIX}")
+
+    def segments(self, sensor):
+        """(start, path) of the sensor's segments, oldest first."""
+        directory = os.path.join(self.directory, sensor)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            (int(name[:-len(self.SUFFIX)]), os.path.join(directory, name))
+            for name in os.listdir(directory) if name.endswith(self.SUFFIX)
+        )
+
+    def open_segment(self, sensor, start):
+        path = self.segment_path(sensor, start)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file = open(path, "ab")
+        size = file.tell()
+        # A torn record from a crash would shift every following one
+        whole = size - size % RECORD.itemsize
+        if whole != size:
+            file.truncate(whole)
+        last = float("-inf")
+        if whole:
+            last = float(np.fromfile(path, dtype=RECORD, count=1, offset=whole - RECORD.itemsize)["timestamp"][0])
+        return {"start": start, "file": file, "last": last}
+
+    def close_segment(self, writer):
+        writer["file"].flush()
+        os.fsync(writer["file"].fileno())
+        writer["file"].close()
+
+    def expire(self, sensor, now):
+        for start, path in self.segments(sensor):
+            if start + self.segment_seconds <= now - self.retention:
+                os.remove(path)
+
+    def append(self, sensor, timestamp, temperature, humidity):
+        """Store one reading; readings older than the last stored one are ignored."""
+        with self.lock:
+            start = int(timestamp // self.segment_seconds) * self.segment_seconds
+            writer = self.writers.get(sensor)
+            if writer is None or writer["start"] != start:
+                if writer is not None and start < writer["start"]:
+                    print(f"[timeseries] Clock went back, reading at {timestamp} ignored")
+                    return False
+                if writer is not None:
+                    self.close_segment(writer)
+                writer = self.writers[sensor] = self.open_segment(sensor, start)
+                self.expire(sensor, timestamp)
+
+            if timestamp <= writer["last"]:
+                return False
+            record = np.array([(timestamp, temperature, humidity)], dtype=RECORD)
+            writer["file"].write(record.tobytes())
+            writer["file"].flush()
+            writer["last"] = timestamp
+            return True
+
+    def close(self):
+        with self.lock:
+            for writer in self.writers.values():
+                self.close_segment(writer)
+            self.writers.clear()
+
+    def slices(self, sensor, start, end):
+        """Memory-mapped records of each segment within [start, end)."""
+        for segment_start, path in self.segments(sensor):
+            if segment_start + self.segment_seconds <= start or segment_start >= end:
+                continue
+            # Only whole records, the writer may be halfway through one
+            count = os.path.getsize(path) // RECORD.itemsize
+            if not count:
+                continue
+            records = np.memmap(path, dtype=RECORD, mode="r", shape=(count,))
+            low, high = np.searchsorted(records["timestamp"], [start, end])
+            if high > low:
+                yield records[low:high]
+
+    def range(self, sensor, start, end):
+        """All records within [start, end) as one array."""
+        parts = [np.array(records) for records in self.slices(sensor, start, end)]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=RECORD)
+
+    def downsample(self, sensor, start, end, step):
+        """Count and mean/min/max of each metric per step seconds bucket.
+
+        Buckets are reduced segment by segment, so memory stays bounded by
+        one segment whatever the range; a bucket straddling two segments
+        is merged afterwards.
+        """
+        partials = []
+        for records in self.slices(sensor, start, end):
+            buckets = ((records["timestamp"] - start) // step).astype(np.int64)
+            firsts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+            part = {"bucket": buckets[firsts], "count": np.diff(np.append(firsts, len(buckets)))}
+            for metric in METRICS:
+                values = records[metric].astype(np.float64)
+                part[f"{metric}_sum"] = np.add.reduceat(values, firsts)
+                part[f"{metric}_min"] = np.minimum.reduceat(values, firsts)
+                part[f"{metric}_max"] = np.maximum.reduceat(values, firsts)
+            partials.append(part)
+
+        if not partials:
+            return {"start": np.empty(0), "count": np.empty(0, dtype=np.int64),
+                    **{metric: {"mean": np.empty(0), "min": np.empty(0), "max": np.empty(0)} for metric in METRICS}}
+
+        merged = {key: np.concatenate([part[key] for part in partials]) for key in partials[0]}
+        firsts = np.concatenate(([0], np.flatnonzero(np.diff(merged["bucket"])) + 1))
+        count = np.add.reduceat(merged["count"], firsts)
+        result = {"start": start + merged["bucket"][firsts] * step, "count": count}
+        for metric in METRICS:
+            result[metric] = {
+                "mean": np.add.reduceat(merged[f"{metric}_sum"], firsts) / count,
+                "min": np.minimum.reduceat(merged[f"{metric}_min"], firsts),
+                "max": np.maximum.reduceat(merged[f"{metric}_max"], firsts),
+            }
+        return result
+
+
+def summary_json(result):
+    """Downsample result as a list of JSON friendly buckets."""
+    columns = [result["start"].tolist(), result["count"].tolist()]
+    for metric in METRICS:
+        for stat in ("mean", "min", "max"):
+            columns.append(np.round(result[metric][stat], 2).tolist())
+
+    buckets = []
+    for start, count, *stats in zip(*columns):
+        bucket = {"start": start, "count": count}
+        for i, metric in enumerate(METRICS):
+            bucket[metric] = dict(zip(("mean", "min", "max"), stats[3 * i:3 * i + 3]))
+        buckets.append(bucket)
+    return buckets
+
+
+def serve_http(store, port, host="127.0.0.1", max_rows=100000):
+    """Local query API in a daemon thread.
+
+    GET /sensors
+    GET /readings?sensor=dht22&from=<epoch>&to=<epoch>   (default last hour)
+    GET /summary?sensor=dht22&from=<epoch>&to=<epoch>&step=60   (default last 24h)
+    """
+    class QueryHandler(BaseHTTPRequestHandler):
+        def send_json(self, body, status=200):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def window(self, query, default_seconds):
+            end = float(query.get("to", [time.time()])[0])
+            start = float(query.get("from", [end - default_seconds])[0])
+            return start, end
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            sensor = query.get("sensor", ["dht22"])[0]
+            try:
+                if url.path == "/sensors":
+                    self.send_json(store.sensors())
+                elif url.path == "/readings":
+                    start, end = self.window(query, 3600)
+                    records = store.range(sensor, start, end)
+                    if len(records) > max_rows:
+                        self.send_json({"error": f"{len(records)} rows, use /summary"}, status=400)
+                        return
+                    rows = zip(*(records[field].astype(np.float64).round(2).tolist() for field in RECORD.names))
+                    self.send_json({"sensor": sensor, "fields": list(RECORD.names), "readings": list(rows)})
+                elif url.path == "/summary":
+                    start, end = self.window(query, 86400)
+                    step = float(query.get("step", [60])[0])
+                    if step <= 0:
+                        raise ValueError("step must be positive")
+                    result = store.downsample(sensor, start, end, step)
+                    self.send_json({"sensor": sensor, "step": step, "buckets": summary_json(result)})
+                else:
+                    self.send_json({"error": "not found"}, status=404)
+            except ValueError as e:
+                self.send_json({"error": str(e)}, status=400)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    threading.Thread(target=server.serve_forever, name="timeseries-http", daemon=True).start()
+    return server
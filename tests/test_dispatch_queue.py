@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "raspismsweb"))
+
+from dispatch_queue import AT_FORMAT, DispatchQueue
+from raspisms_client import RaspiSMSError
+
+
+class FakeClient:
+    """RaspiSMSClient stand-in raising the queued errors before succeeding."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def schedule(self, text, numbers, id_phone, at):
+        with self.lock:
+            self.calls.append((text, list(numbers), id_phone, at))
+            if self.errors:
+                error = self.errors.pop(0)
+                if error is not None:
+                    raise error
+        return {"error": 0}
+
+
+class DispatchQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.dead_letter_path = os.path.join(tempfile.mkdtemp(), "dead.jsonl")
+        self.at = (datetime.now() + timedelta(minutes=5)).strftime(AT_FORMAT)
+
+    def make_queue(self, client, **kwargs):
+        kwargs.setdefault("rate_per_minute", 0)
+        kwargs.setdefault("base_delay", 0.001)
+        return DispatchQueue(client, ["1"], self.dead_letter_path, workers_per_modem=1, **kwargs)
+
+    def dispatch(self, queue, messages):
+        # A stuck worker would hang queue.join(), fail instead
+        return asyncio.run(asyncio.wait_for(queue.dispatch_async(messages), timeout=5))
+
+    def dead_lettered(self):
+        if not os.path.exists(self.dead_letter_path):
+            return []
+        with open(self.dead_letter_path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_transient_error_is_retried(self):
+        client = FakeClient([RaspiSMSError("busy", status_code=503), None])
+        results = self.dispatch(self.make_queue(client), [("hello", "+33600000001", self.at)])
+
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual([(r[2], r[4]) for r in results], [(["+33600000001"], None)])
+        self.assertEqual(self.dead_lettered(), [])
+
+    def test_dead_letter_after_max_attempts(self):
+        client = FakeClient([RaspiSMSError("busy", status_code=503)] * 3)
+        queue = self.make_queue(client, max_attempts=3)
+        results = self.dispatch(queue, [("hello", "+33600000001", self.at)])
+
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(len(results), 1)
+        self.assertIsInstance(results[0][4], RaspiSMSError)
+        records = self.dead_lettered()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["attempts"], 3)
+
+    def test_permanent_error_is_not_retried(self):
+        client = FakeClient([RaspiSMSError("bad request", status_code=400)])
+        results = self.dispatch(self.make_queue(client), [("hello", "+33600000001", self.at)])
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertIsNotNone(results[0][4])
+        self.assertEqual(len(self.dead_lettered()), 1)
+
+    def test_unexpected_error_does_not_stall_the_queue(self):
+        # More jobs than workers: a dead worker would leave jobs in the queue
+        client = FakeClient([TypeError("boom"), TypeError("boom")])
+        messages = [(f"text {i}", "+33600000001", self.at) for i in range(4)]
+        results = self.dispatch(self.make_queue(client), messages)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(sum(isinstance(r[4], TypeError) for r in results), 2)
+        self.assertEqual(sum(r[4] is None for r in results), 2)
+        self.assertEqual(len(self.dead_lettered()), 2)
+
+    def paced_times(self, client):
+        start = datetime.strptime(self.at, AT_FORMAT)
+        return sorted((datetime.strptime(call[3], AT_FORMAT) - start).total_seconds() for call in client.calls)
+
+    def test_rate_limit_spreads_send_times(self):
+        client = FakeClient()
+        queue = self.make_queue(client, rate_per_minute=60, burst=10)
+        numbers = [f"+336{i:08d}" for i in range(300)]
+        results = self.dispatch(queue, [("hello", number, self.at) for number in numbers])
+
+        # One bucketful per call, each one second per SMS after the previous one
+        self.assertEqual([len(call[1]) for call in client.calls], [10] * 30)
+        self.assertEqual(self.paced_times(client), [10.0 * i for i in range(30)])
+        # Results keep the requested time so the caller can match them
+        self.assertTrue(all(r[4] is None and r[1] == self.at for r in results))
+        self.assertEqual(sum(len(r[2]) for r in results), 300)
+
+    def test_retry_keeps_its_send_time(self):
+        client = FakeClient([RaspiSMSError("busy", status_code=503)])
+        queue = self.make_queue(client, rate_per_minute=60, burst=10)
+        numbers = [f"+336{i:08d}" for i in range(20)]
+        self.dispatch(queue, [("hello", number, self.at) for number in numbers])
+
+        # The failed attempt and its retry share one reservation
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(sorted(set(self.paced_times(client))), [0.0, 10.0])
+
+    def test_no_rate_limit_sends_full_batches(self):
+        client = FakeClient()
+        numbers = [f"+336{i:08d}" for i in range(300)]
+        self.dispatch(self.make_queue(client), [("hello", number, self.at) for number in numbers])
+
+        self.assertEqual(sorted(len(call[1]) for call in client.calls), [100, 200])
+        self.assertEqual({call[3] for call in client.calls}, {self.at})
+
+if __name__ == "__main__":
+    unittest.main()
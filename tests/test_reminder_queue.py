@@ -0,0 +1,138 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "raspismsweb"))
+
+from reminder_queue import ReminderQueue
+
+NOW = 1_800_000_000.0
+HOUR = 3600
+
+
+def event(event_id, start, user_email="student@example.com", **fields):
+    return dict({"id": event_id, "user_email": user_email, "title": event_id, "start_ts": start}, **fields)
+
+
+class ReminderQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.snapshot_path = os.path.join(tempfile.mkdtemp(), "reminders.json")
+        self.queue = ReminderQueue(self.snapshot_path, [24 * 60, 60])
+
+    def reminders(self, queue=None):
+        queue = queue or self.queue
+        return sorted((key[0], key[2], r["due"]) for key, r in queue.reminders.items())
+
+    def test_one_reminder_per_lead(self):
+        start = NOW + 2 * 24 * HOUR
+        self.queue.upsert(event("exam", start), NOW)
+
+        self.assertEqual(self.reminders(), [("exam", 60, start - HOUR), ("exam", 24 * 60, start - 24 * HOUR)])
+
+    def test_only_closest_overdue_lead_is_kept(self):
+        # Both the day before and the hour before are already past
+        start = NOW + 30 * 60
+        self.queue.upsert(event("exam", start), NOW)
+
+        self.assertEqual(self.reminders(), [("exam", 60, start - HOUR)])
+
+    def test_overdue_lead_kept_next_to_future_ones(self):
+        start = NOW + 2 * HOUR
+        self.queue.upsert(event("exam", start), NOW)
+
+        self.assertEqual([lead for _, lead, _ in self.reminders()], [60, 24 * 60])
+
+    def test_past_event_has_no_reminder(self):
+        self.queue.upsert(event("exam", NOW - 60), NOW)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_user_leads(self):
+        queue = ReminderQueue(self.snapshot_path, [60], {"late@example.com": [15]})
+        queue.upsert(event("exam", NOW + 2 * HOUR, "late@example.com"), NOW)
+        queue.upsert(event("exam", NOW + 2 * HOUR), NOW)
+
+        self.assertEqual(sorted(key[1:] for key in queue.reminders),
+                         [("late@example.com", 15), ("student@example.com", 60)])
+
+    def test_moved_event_is_rescheduled(self):
+        self.queue.upsert(event("exam", NOW + 2 * 24 * HOUR), NOW)
+        self.queue.upsert(event("exam", NOW + 3 * 24 * HOUR), NOW)
+
+        self.assertEqual(len(self.queue), 2)
+        # The stale heap entries are skipped when they come due
+        self.assertEqual(self.queue.pop_due(NOW + 2 * 24 * HOUR - 1, NOW), [])
+        due = self.queue.pop_due(NOW + 3 * 24 * HOUR, NOW)
+        self.assertEqual([(lead, due_at) for lead, due_at, _ in due],
+                         [(24 * 60, NOW + 2 * 24 * HOUR), (60, NOW + 3 * 24 * HOUR - HOUR)])
+
+    def test_same_due_time_only_refreshes_details(self):
+        self.queue.upsert(event("exam", NOW + 2 * HOUR, location="A"), NOW)
+        heap_size = len(self.queue.heap)
+        self.queue.upsert(event("exam", NOW + 2 * HOUR, location="B"), NOW)
+
+        self.assertEqual(len(self.queue.heap), heap_size)
+        self.assertEqual({r["event"]["location"] for r in self.queue.reminders.values()}, {"B"})
+
+    def test_heap_is_rebuilt_when_mostly_stale(self):
+        for i in range(500):
+            self.queue.upsert(event("exam", NOW + 2 * 24 * HOUR + i * 60), NOW)
+
+        self.assertEqual(len(self.queue), 2)
+        self.assertLessEqual(len(self.queue.heap), 2 * len(self.queue) + 64)
+
+    def test_pop_due_in_due_order_and_drops_started_events(self):
+        self.queue.upsert(event("later", NOW + 2 * HOUR), NOW)
+        self.queue.upsert(event("sooner", NOW + 90 * 60), NOW)
+        self.queue.upsert(event("started", NOW + 10 * 60), NOW)
+
+        due = self.queue.pop_due(NOW + 2 * HOUR, NOW + 20 * 60)
+        self.assertEqual([(e["id"], lead) for lead, _, e in due],
+                         [("sooner", 24 * 60), ("later", 24 * 60), ("sooner", 60), ("later", 60)])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_push_back(self):
+        self.queue.upsert(event("exam", NOW + 30 * 60), NOW)
+        (lead, due_at, popped), = self.queue.pop_due(NOW + 120, NOW)
+        self.queue.push_back(lead, due_at, popped)
+
+        self.assertEqual([(lead, due_at)], [(l, d) for l, d, _ in self.queue.pop_due(NOW + 120, NOW)])
+
+    def test_remove(self):
+        self.queue.upsert(event("exam", NOW + 2 * 24 * HOUR), NOW)
+        self.queue.remove("exam", "student@example.com")
+
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(self.queue.pop_due(NOW + 3 * 24 * HOUR, NOW), [])
+
+    def test_replace_all_drops_unknown_events(self):
+        self.queue.upsert(event("gone", NOW + 2 * 24 * HOUR), NOW)
+        self.queue.upsert(event("kept", NOW + 2 * 24 * HOUR), NOW)
+        self.queue.replace_all([event("kept", NOW + 2 * 24 * HOUR), event("new", NOW + 2 * 24 * HOUR)], NOW)
+
+        self.assertEqual({key[0] for key in self.queue.reminders}, {"kept", "new"})
+
+    def test_snapshot_round_trip(self):
+        self.queue.upsert(event("exam", NOW + 2 * 24 * HOUR, location="B12"), NOW)
+        self.queue.save()
+        restored = ReminderQueue(self.snapshot_path, [24 * 60, 60])
+
+        self.assertEqual(self.reminders(restored), self.reminders())
+        self.assertEqual({r["event"]["location"] for r in restored.reminders.values()}, {"B12"})
+        self.assertFalse(restored.dirty)
+
+    def test_corrupted_snapshot_starts_empty(self):
+        with open(self.snapshot_path, "w") as file:
+            file.write("[{\"lead\": 60")
+        self.assertEqual(len(ReminderQueue(self.snapshot_path)), 0)
+
+    def test_iso_start_without_start_ts(self):
+        self.queue.upsert({"id": "exam", "user_email": "student@example.com",
+                           "start": "2030-01-01T10:00:00+00:00"}, NOW)
+        self.assertEqual({r["due"] for r in self.queue.reminders.values()},
+                         {1893492000.0 - HOUR, 1893492000.0 - 24 * HOUR})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "raspismsweb"))
+
+from sent_ledger import SentLedger, event_start, event_timestamp
+
+DAY = 24 * 3600
+
+
+class SentLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "sent_sms.jsonl")
+
+    def write(self, content):
+        with open(self.path, "w") as file:
+            file.write(content)
+
+    def records(self):
+        with open(self.path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_add_many_is_durable_and_deduplicated(self):
+        ledger = SentLedger(self.path)
+        end = time.time() + DAY
+        ledger.add_many([("exam@1:60", "a@example.com", end), ("exam@1:60", "b@example.com", end)])
+        ledger.add_many([("exam@1:60", "a@example.com", end)])
+        ledger.close()
+
+        self.assertEqual(len(self.records()), 2)
+        reopened = SentLedger(self.path)
+        self.assertIn(("exam@1:60", "a@example.com"), reopened)
+        self.assertIn(("exam@1:60", "b@example.com"), reopened)
+        self.assertNotIn(("exam@1:60", "c@example.com"), reopened)
+
+    def test_legacy_json_file_is_migrated(self):
+        self.write(json.dumps({"exam": ["a@example.com", "b@example.com"], "demo": []}))
+        ledger = SentLedger(self.path)
+
+        self.assertEqual(len(ledger), 2)
+        self.assertIn(("exam", "b@example.com"), ledger)
+        self.assertEqual(sorted(r["user_email"] for r in self.records()), ["a@example.com", "b@example.com"])
+
+    def test_torn_line_is_skipped(self):
+        end = time.time() + DAY
+        self.write(json.dumps({"event_id": "exam", "user_email": "a@example.com", "end": end}) + "\n"
+                   + '{"event_id": "demo", "user_em')
+        ledger = SentLedger(self.path)
+
+        self.assertEqual(len(ledger), 1)
+        self.assertIn(("exam", "a@example.com"), ledger)
+        # Compaction rewrote the file without the torn line
+        self.assertEqual(len(self.records()), 1)
+
+    def test_expired_events_are_evicted(self):
+        now = time.time()
+        self.write("".join(json.dumps(r) + "\n" for r in [
+            {"event_id": "old", "user_email": "a@example.com", "end": now - 8 * DAY},
+            {"event_id": "recent", "user_email": "a@example.com", "end": now - 6 * DAY},
+            {"event_id": "ended", "user_email": "a@example.com", "sent_at": now - 10 * DAY, "end": None},
+        ]))
+        ledger = SentLedger(self.path, retention=7 * DAY)
+
+        self.assertEqual({key[0] for key in ledger.sent}, {"recent"})
+        self.assertEqual([r["event_id"] for r in self.records()], ["recent"])
+
+    def test_latest_end_of_an_event_wins(self):
+        now = time.time()
+        ledger = SentLedger(self.path, retention=DAY)
+        ledger.add("exam", "a@example.com", now - 2 * DAY)
+        ledger.add("exam", "b@example.com", now + DAY)
+        ledger.compact(now)
+
+        self.assertEqual(len(ledger), 2)
+
+    def test_compact_if_due(self):
+        now = time.time()
+        ledger = SentLedger(self.path, retention=DAY, compact_interval=DAY)
+        ledger.add("exam", "a@example.com", now)
+
+        ledger.compact_if_due(now + DAY / 2)
+        self.assertEqual(len(ledger), 1)
+        ledger.compact_if_due(now + 2 * DAY + 1)
+        self.assertEqual(len(ledger), 0)
+        self.assertEqual(self.records(), [])
+        # Still appendable after a compaction
+        ledger.add("demo", "a@example.com", now + 3 * DAY)
+        self.assertEqual(len(self.records()), 1)
+
+    def test_event_timestamps(self):
+        self.assertEqual(event_timestamp("2030-01-01T10:00:00Z"), 1893492000.0)
+        self.assertEqual(event_timestamp(12.5), 12.5)
+        self.assertIsNone(event_timestamp("not a date"))
+        self.assertIsNone(event_timestamp(None))
+        self.assertEqual(event_start({"start_ts": 0, "start": "2030-01-01T10:00:00Z"}), 0)
+        self.assertEqual(event_start({"start": "2030-01-01T10:00:00Z"}), 1893492000.0)
+
+
+if __name__ == "__main__":
+    unittest.main()